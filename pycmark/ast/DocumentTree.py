@@ -16,6 +16,7 @@ class Section(TypedTree.GenerateConstructor('Section', ['Level', 'Data'])):
         - Level : Section indentation level (heading depth)
         - Data  : List of AST nodes
     """
+    __slots__ = ()
 
     @classmethod
     def fromBlocks(cls, blocks, firstBlock=False):
@@ -44,6 +45,7 @@ class DocumentTree(TypedTree.GenerateConstructor('DocumentTree', ['ID', 'Number'
         - Section  : Section content associated with root node
         - Children : DocumentTree list for children of root node
     """
+    __slots__ = ()
 
     def walk(self):
         out = [self]
@@ -135,3 +137,47 @@ class DocumentTree(TypedTree.GenerateConstructor('DocumentTree', ['ID', 'Number'
             out = out[1:]
         return out
 
+################################################################################
+
+class OutlineTree(TypedTree.GenerateConstructor('OutlineTree', ['Level', 'Title', 'Line', 'Children'])):
+    """Heading tree built from a document outline instead of an AST
+
+    An OutlineTree has the same nesting as the DocumentTree of the document,
+    but only stores heading data, so it can be generated without an AST.
+        - Level    : heading depth (1 for the root node)
+        - Title    : heading text
+        - Line     : heading source line (0 for the root node)
+        - Children : OutlineTree list for sub-headings
+    """
+    __slots__ = ()
+
+    def walk(self):
+        out = [self]
+        for child in self.Children:
+            out += child.walk()
+        return out
+
+    @property
+    def n_children(self):
+        return len(self.Children) + sum([child.n_children for child in self.Children])
+
+    @property
+    def src(self):
+        return self.Line
+
+    @property
+    def title(self):
+        return self.Title
+
+    @classmethod
+    def fromOutline(cls, outline):
+        """Nest (level, text, line) entries from CmarkDocument.outline like DocumentTree.fromAst"""
+        entries = collections.deque([e for e in outline if e[0] > 1])
+
+        def buildTree(level, title, line):
+            children = []
+            while len(entries) > 0 and entries[0][0] > level:
+                children.append(buildTree(*entries.popleft()))
+            return OutlineTree(Level=level, Title=title, Line=line, Children=children)
+
+        return buildTree(1, '', 0)
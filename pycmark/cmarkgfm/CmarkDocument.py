@@ -1,91 +1,739 @@
 import ctypes
-from . import cmarkgfm
+import re
+import weakref
+from array import array
+from . import bindings
 from ..util.TypedTree import TypedTree
 
 
-cmarkgfm.document_to_html.restype = ctypes.POINTER(ctypes.c_char)
+# flattened AST export format (see document_to_ast in bin/main.c)
+AST_VERSION = 1
+AST_HEADER_SIZE = 4   # int32 values in header
+AST_RECORD_SIZE = 14  # int32 values per node record
+
+# heading outline export format (see document_to_outline in bin/main.c)
+OUTLINE_VERSION = 1
+
+# node attribute decoding
+LITERAL_TAGS = {'text', 'code_block', 'code', 'html_block', 'html_inline', 'latex_block', 'latex_inline'}
+LIST_TYPES = ['None', 'Bullet', 'Ordered']
+LIST_DELIMS = ['None', 'Period', 'Paren']
+ALIGNMENTS = {'l': "Left", 'c': "Center", 'r': "Right"}
+
+# link reference definitions apply to the whole document, so edits can't be reparsed locally.
+# they can also start inside block quotes and list items, so any container prefix is allowed.
+REFERENCE_DEFINITION = re.compile(r'^[ \t]*(?:(?:>|[-+*]|\d{1,9}[.)])[ \t]*)*\[[^\]]+\]:', re.M)
+
+# line scanning for sharded parsing: blocks that can span blank lines, and list items
+LINE = re.compile(r'[^\r\n]*(?:\r\n?|\n)|[^\r\n]+$')
+BLANK_LINE = re.compile(r'^[ \t]*\r?\n?$')
+LIST_MARKER = re.compile(r'^(?:[-+*]|\d{1,9}[.)])(?:[ \t]|\r?\n?$)')
+FENCE_OPEN = re.compile(r'^ {0,3}(?:(`{3,})[^`\r\n]*|(~{3,})[^\r\n]*)\r?\n?$')
+FENCE_CLOSE = re.compile(r'^ {0,3}(`{3,}|~{3,})[ \t]*\r?\n?$')
+HTML_BLOCK = [  # (start, end) for the html block types that end at a marker rather than a blank line
+    (re.compile(r'^ {0,3}<(?:script|pre|style|textarea)(?:[ \t>]|\r?\n?$)', re.I),
+     re.compile(r'</(?:script|pre|style|textarea)>', re.I)),
+    (re.compile(r'^ {0,3}<!--'), re.compile(r'-->')),
+    (re.compile(r'^ {0,3}<\?'), re.compile(r'\?>')),
+    (re.compile(r'^ {0,3}<![A-Za-z]'), re.compile(r'>')),
+    (re.compile(r'^ {0,3}<!\[CDATA\['), re.compile(r'\]\]>')),
+]
+
+# cmark_event_type values returned by cmark_iter_next
+EVENT_DONE = 1
+EVENT_ENTER = 2
+EVENT_EXIT = 3
+
+# trusted constructor for position nodes: POSITION(r1, c1, r2, c2)
+POSITION = TypedTree.Trusted('position', ('r1', 'c1', 'r2', 'c2'))
 
 class CmarkDocument(object):
+    _options = None  # cmark options the document was parsed with (None: library defaults)
 
     def __init__(self, txt, encoding='utf_8'):
         if not isinstance(txt, bytes):
             txt = txt.encode(encoding=encoding)
-        self._doc = cmarkgfm.string_to_document(txt)
+        if hasattr(bindings, 'buffer_to_document'):
+            self._attach(bindings.buffer_to_document(txt, len(txt)))
+        else:
+            self._attach(bindings.string_to_document(txt))
+
+    @classmethod
+    def fromNode(cls, node, options=None):
+        """Wrap a native document node (the CmarkDocument takes ownership of it)
+
+        options are the cmark options the node was parsed with, which are
+        also used to render it (library defaults if None).
+        """
+        doc = cls.__new__(cls)
+        doc._attach(node)
+        doc._options = options
+        return doc
+
+    ##### LIFECYCLE #####
+
+    def _attach(self, node):
+        self._doc = node
+        self._finalizer = weakref.finalize(self, bindings.cmark_node_free, node)
+
+    def close(self):
+        """Release the native document tree (also done when the object is garbage collected)"""
+        self._finalizer()
+        self._doc = None
+
+    @property
+    def closed(self):
+        return self._doc is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def _root(self):
+        if self._doc is None:
+            raise ValueError("Operation on a closed CmarkDocument")
+        return self._doc
+
+    ##### RENDERING #####
 
     def toHTML(self):
-        result = cmarkgfm.document_to_html(self._doc)
-        out = ctypes.cast(result, ctypes.c_char_p).value.decode()
-        cmarkgfm.cmark_get_default_mem_allocator().contents.free(result)
-        return out
+        return self._render(bindings.document_to_html, 'document_to_html_with_options')
 
     def toLatex(self):
-        result = cmarkgfm.document_to_latex(self._doc)
+        return self._render(bindings.document_to_latex, 'document_to_latex_with_options')
+
+    def _render(self, renderer, with_options=None):
+        if self._options is not None and with_options is not None:
+            result = getattr(bindings, with_options)(self._root, self._options)
+        else:
+            result = renderer(self._root)
         out = ctypes.cast(result, ctypes.c_char_p).value.decode()
-        cmarkgfm.cmark_get_default_mem_allocator().contents.free(result)
+        bindings.cmark_get_default_mem_allocator().contents.free(result)
+        return out
+
+    def toAST(self, lazy=False, positions='node', literals='copy', intern=None):
+        """Convert to a TypedTree AST
+
+        positions selects how source positions are stored:
+            - 'node'   : a position node on every node (default, same as the JSON format)
+            - 'packed' : an int pos field on every node that indexes a packed
+                         array('i') of (r1, c1, r2, c2) stored as bytes in the
+                         positions field of the Document (see packedPosition)
+            - None     : no source positions
+
+        literals selects how node text is stored:
+            - 'copy'   : a str Text field on every literal node (default)
+            - 'packed' : an int lit field on every literal node that indexes a
+                         packed array('i') of (offset, length) stored as bytes
+                         in the literals field of the Document, into the string
+                         pool stored in its pool field (see packedLiteral).
+                         Needs the flat AST export (document_to_ast).
+
+        intern is an optional TypedTree.Interner: nodes are hash-consed as they
+        are built, so identical subtrees (most useful with positions=None) are
+        shared within the AST and with other ASTs built with the same table.
+
+        If lazy is True a CmarkNodeView is returned instead, which decodes nodes
+        from the native tree only when they are accessed.  The view keeps the
+        document alive and can't be used once the document is closed.
+        """
+        if lazy:
+            return CmarkNodeView(self, self._root, tag='Document')
+        builder = ASTBuilder(positions, literals, intern)
+        if literals == 'packed':
+            data = self._exportAST() if hasattr(bindings, 'document_to_ast') else None
+            if data is None:
+                raise RuntimeError("Packed literals need the flat AST export (document_to_ast)")
+            return self._recordsToAST(data, builder)
+        if bindings.accessors is not None:
+            address = ctypes.cast(self._root, ctypes.c_void_p).value
+            return builder.document(bindings.accessors.build_children(address, builder))
+        if hasattr(bindings, 'document_to_ast'):
+            data = self._exportAST()
+            if data is not None:
+                return self._recordsToAST(data, builder)
+        return self._eventsToAST(builder)
+
+    def outline(self):
+        """List of (level, text, line) for the top-level headings of the document
+
+        Heading text is the text of the heading's inlines, with soft breaks as
+        spaces and hard breaks as newlines.  Only headings are visited, so no
+        AST is built for the rest of the document.
+        """
+        if hasattr(bindings, 'document_to_outline'):
+            length = ctypes.c_uint64()
+            result = bindings.document_to_outline(self._root, ctypes.byref(length))
+            data = ctypes.string_at(result, length.value)
+            bindings.cmark_get_default_mem_allocator().contents.free(result)
+            version, n_headings, n_pool = array('i', data[:12])
+            if version != OUTLINE_VERSION:
+                raise ValueError("Unsupported outline export version: {}".format(version))
+            records = array('i', data[12:12+16*n_headings])
+            pool = data[12+16*n_headings:12+16*n_headings+n_pool]
+            return [(records[i], pool[records[i+2]:records[i+2]+records[i+3]].decode(), records[i+1])
+                    for i in range(0, len(records), 4)]
+        return [(bindings.cmark_node_get_heading_level(node), self._headingText(node), bindings.cmark_node_get_start_line(node))
+                for node in self._children(self._root)
+                if bindings.cmark_node_get_type_string(node) == b'heading']
+
+    @staticmethod
+    def _headingText(heading):
+        out = []
+        it = bindings.cmark_iter_new(heading)
+        try:
+            while bindings.cmark_iter_next(it) != EVENT_DONE:
+                if bindings.cmark_iter_get_event_type(it) != EVENT_ENTER:
+                    continue
+                node = bindings.cmark_iter_get_node(it)
+                tag = bindings.cmark_node_get_type_string(node).decode()
+                if tag == 'softbreak':
+                    out.append(' ')
+                elif tag == 'linebreak':
+                    out.append('\n')
+                elif tag in LITERAL_TAGS:
+                    out.append(bindings.cmark_node_get_literal(node).decode())
+        finally:
+            bindings.cmark_iter_free(it)
+        return ''.join(out)
+
+    @staticmethod
+    def packedPosition(tt, node):
+        """(r1, c1, r2, c2) for a node of an AST generated with packed positions"""
+        return tuple(array('i', tt.positions[16*node.pos:16*node.pos+16]))
+
+    @staticmethod
+    def packedLiteral(tt, node):
+        """Text of a literal node of an AST generated with packed literals"""
+        offset, length = array('i', tt.literals[8*node.lit:8*node.lit+8])
+        return tt.pool[offset:offset+length].decode()
+
+    def events(self):
+        """Generate (event, tag, attributes) tuples for a depth-first walk of the document
+
+        event is 'enter' or 'exit', and every enter is matched by an exit (cmark_iter
+        only reports enter for leaf nodes, so their exits are generated here).
+        attributes is a dict with the fields toAST would give the node other than
+        children (position, Text, Level, ...) for enter events and None for exit
+        events.  The walk starts and ends with the 'document' node.
+        """
+        it = bindings.cmark_iter_new(self._root)
+        try:
+            ev = bindings.cmark_iter_next(it)
+            while ev != EVENT_DONE:
+                self._root  # raises if document was closed during the walk
+                node = bindings.cmark_iter_get_node(it)
+                tag = bindings.cmark_node_get_type_string(node).decode()
+                leaf = not bindings.cmark_node_first_child(node)
+                if ev == EVENT_ENTER:
+                    yield 'enter', tag, self._attributes(node, tag)
+                    if leaf:
+                        yield 'exit', tag, None
+                elif not leaf:  # exit for a childless node was already generated
+                    yield 'exit', tag, None
+                ev = bindings.cmark_iter_next(it)
+        finally:
+            bindings.cmark_iter_free(it)
+
+    ##### INCREMENTAL REPARSE #####
+
+    @classmethod
+    def reparse(cls, tt, lines, first, last, replacement):
+        """Update an AST for an edit that replaces a range of source lines
+
+        tt is the AST of the source lines (list of str without line endings)
+        and lines first..last (1-based, inclusive) are replaced by the list of
+        lines in replacement.  Use last = first-1 to insert before line first.
+        Returns (lines, AST) for the edited source, where lines is a
+        SourceLines.  If lines is already a SourceLines (e.g. returned by an
+        earlier call) the edit is made to it in place, otherwise it is copied
+        and scanned for link reference definitions once.
+
+        Only the top-level blocks overlapping the edit and one block of context
+        on either side are reparsed; blocks after the edit are shifted by the
+        change in line count as ShiftedNode views, so they aren't rebuilt.  A
+        full reparse is done if the trailing context block comes out
+        differently (e.g. an unclosed code fence was opened) or if the source
+        defines link references.
+        """
+        if not isinstance(lines, SourceLines):
+            lines = SourceLines(lines)
+        delta = len(replacement) - (last - first + 1)
+        nodes = tt.nodes
+
+        # context blocks before (lo) and after (hi) the edit
+        lo = cls._bisect(nodes, lambda n: n.position.r2 >= first) - 1
+        hi = cls._bisect(nodes, lambda n: n.position.r1 > last)
+        lines[first-1:last] = replacement
+        a = nodes[lo].position.r1 if lo >= 0 else 1
+        b = nodes[hi].position.r2 + delta if hi < len(nodes) else len(lines)
+
+        # definitions anywhere in the document (including the removed lines) or
+        # added by the edit affect links in the region
+        region = '\n'.join(lines[a-1:b]) + '\n'
+        if lines.definitions or REFERENCE_DEFINITION.search(region):
+            return lines, cls._parseLines(lines)
+        with cls(region) as doc:
+            middle = [cls._shiftLines(n, a-1) for n in doc.toAST().nodes]
+
+        # trailing context must be unaffected by the edit for the splice to be valid
+        if hi < len(nodes):
+            expected = nodes[hi].position
+            if len(middle) == 0 or middle[-1]._tag != nodes[hi]._tag \
+                    or middle[-1].position != expected._replace(r1=expected.r1+delta, r2=expected.r2+delta):
+                return lines, cls._parseLines(lines)
+        trailing = [ShiftedNode(n, delta) for n in nodes[hi+1:]] if delta != 0 else list(nodes[hi+1:])
+        return lines, TypedTree.Build('Document', nodes=list(nodes[:max(lo, 0)]) + middle + trailing)
+
+    @staticmethod
+    def _bisect(nodes, key):
+        """Index of the first node for which key is true, for a key that is false and then true in document order"""
+        i, j = 0, len(nodes)
+        while i < j:
+            m = (i + j) // 2
+            if key(nodes[m]):
+                j = m
+            else:
+                i = m + 1
+        return i
+
+    @classmethod
+    def _parseLines(cls, lines):
+        """Parse all of a SourceLines and update its cached definitions flag"""
+        txt = '\n'.join(lines) + '\n'
+        lines.definitions = REFERENCE_DEFINITION.search(txt) is not None
+        with cls(txt) as doc:
+            return doc.toAST()
+
+    @classmethod
+    def _shiftLines(cls, node, delta):
+        """Shift the source line numbers of an AST node and its descendants"""
+        if delta == 0:
+            return node
+        p = node.position
+        return node._replace(
+            position=p._replace(r1=p.r1+delta, r2=p.r2+delta),
+            children=tuple([cls._shiftLines(c, delta) for c in node.children]))
+
+    ##### SHARDED PARSING #####
+
+    @classmethod
+    def shardSource(cls, txt, size):
+        """Split markdown source into (first line, shard) pairs of about size characters
+
+        Shards are only split before an unindented line that follows a blank
+        line and doesn't start a list item, outside fenced code and html
+        blocks, so every shard boundary is also a top-level block boundary of
+        the whole document.  Blank lines stay with the preceding shard so that
+        open blocks are closed on the same line in both parses.  A single
+        shard is returned if the source defines link references.
+        """
+        if REFERENCE_DEFINITION.search(txt):
+            return [(1, txt)]
+        shards = []
+        start = 0      # index of first line in current shard
+        length = 0     # characters in current shard
+        closer = None  # (end pattern, opening fence or None) of the open fence or html block
+        blank = False  # previous line was a blank line outside fences and html blocks
+        lines = LINE.findall(txt)
+        for i, line in enumerate(lines):
+            if closer is not None:
+                end, fence = closer
+                m = end.search(line)
+                if m and (fence is None or (m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence))):
+                    closer = None
+                blank = False
+            elif BLANK_LINE.match(line):
+                blank = True
+            else:
+                if blank and length >= size and line[0] not in ' \t' and not LIST_MARKER.match(line):
+                    shards.append((start+1, ''.join(lines[start:i])))
+                    start, length = i, 0
+                blank = False
+                m = FENCE_OPEN.match(line)
+                if m:
+                    closer = (FENCE_CLOSE, m.group(1) or m.group(2))
+                else:
+                    for begin, end in HTML_BLOCK:
+                        m = begin.match(line)
+                        if m:
+                            if not end.search(line, m.end()):
+                                closer = (end, None)
+                            break
+            length += len(line)
+        shards.append((start+1, ''.join(lines[start:])))
+        return shards
+
+    @classmethod
+    def stitch(cls, shards):
+        """Join the ASTs of consecutive shards given as (first line, AST) pairs
+
+        Returns None if a shard ends inside a code or html block, which means
+        that a boundary wasn't a block boundary of the whole document.
+        """
+        nodes = []
+        for i, (first, tt) in enumerate(shards):
+            if i+1 < len(shards) and len(tt.nodes) > 0:
+                last = tt.nodes[-1]
+                if last._tag in {'code_block', 'html_block'} and last.position.r2 >= shards[i+1][0] - first:
+                    return None
+            nodes += [cls._shiftLines(n, first-1) for n in tt.nodes]
+        return TypedTree.Build('Document', nodes=nodes)
+
+    ##### FLATTENED AST DECODING #####
+
+    def _exportAST(self):
+        """Serialize the node tree into a flat record buffer with a single native call"""
+        length = ctypes.c_uint64()
+        result = bindings.document_to_ast(self._root, ctypes.byref(length))
+        if not result:
+            return None
+        out = ctypes.string_at(result, length.value)
+        bindings.cmark_get_default_mem_allocator().contents.free(result)
         return out
 
-    def toAST(self):
-        return TypedTree.Build('Document', nodes=[self._toAST(c) for c in self._children(self._doc)])
+    @classmethod
+    def _recordsToAST(cls, data, builder=None):
+        """Decode a flattened AST buffer into a TypedTree in a single pass"""
+        version, n_types, n_records, n_pool = array('i', data[:4*AST_HEADER_SIZE])
+        if version != AST_VERSION:
+            raise ValueError("Unsupported AST export version: {}".format(version))
+        a = 4*AST_HEADER_SIZE
+        b = a + 4*2*n_types
+        c = b + 4*AST_RECORD_SIZE*n_records
+        type_table = array('i', data[a:b])
+        records = array('i', data[b:c])
+        pool = data[c:c+n_pool]
+        builder = builder or ASTBuilder()
+        types = [pool[type_table[2*i]:type_table[2*i]+type_table[2*i+1]].decode() for i in range(n_types)]
+
+        # records are in preorder with depth, so a node is complete when a record at
+        # the same or lower depth is reached.  first record is the document node.
+        children = [[]]  # child list for each open node
+        pending = []     # record index for each open node
+        def close():
+            i = pending.pop()
+            rec = records[i*AST_RECORD_SIZE:(i+1)*AST_RECORD_SIZE]
+            node = cls._recordToAST(types[rec[0]], rec, pool, children.pop(), builder)
+            children[-1].append(node)
+        for i in range(1, n_records):
+            depth = records[i*AST_RECORD_SIZE + 1]
+            while len(pending) >= depth:
+                close()
+            pending.append(i)
+            children.append([])
+        while len(pending) > 0:
+            close()
+
+        return builder.document(children[0])
+
+    @staticmethod
+    def _recordToAST(tag, rec, pool, children, builder):
+        def string(i):
+            return pool[rec[10+2*i]:rec[10+2*i]+rec[11+2*i]].decode()
+
+        attr = {}
+        if tag in LITERAL_TAGS:
+            builder.literal(attr, pool, rec[10], rec[11])
+        if tag == 'heading':
+            attr['Level'] = rec[6]
+        elif tag == 'code_block':
+            attr['Info'] = string(1)
+        elif tag in {'link', 'image'}:
+            attr['Destination'] = string(0)
+            attr['Title'] = string(1)
+        elif tag == 'list':
+            attr['Type'] = LIST_TYPES[rec[6]]
+            attr['Tight'] = rec[7] != 0
+            if attr['Type'] == 'Ordered':
+                attr['Start'] = rec[8]
+                attr['Delim'] = LIST_DELIMS[rec[9]]
+        elif tag == 'table_cell':
+            attr['Alignment'] = ALIGNMENTS.get(chr(rec[6]), 'Left')
+
+        return builder(tag, rec[2:6], children, **attr)
 
     ##### AST GENERATION #####
 
+    def _eventsToAST(self, builder=None):
+        """Build a TypedTree from the event stream without recursion"""
+        builder = builder or ASTBuilder()
+        children = [[]]  # child list for each open node
+        entered = []     # (tag, attributes) for each open node
+        for event, tag, attr in self.events():
+            if event == 'enter':
+                children.append([])
+                entered.append((tag, attr))
+            elif tag == 'document':
+                return builder.document(children.pop())
+            else:
+                tag, attr = entered.pop()
+                p = attr.pop('position')
+                node = builder(tag, (p.r1, p.c1, p.r2, p.c2), children.pop(), **attr)
+                children[-1].append(node)
+
     @classmethod
     def _children(cls, node):
-        out = [cmarkgfm.cmark_node_first_child(node)]
+        out = [bindings.cmark_node_first_child(node)]
         while out[-1]:  # iterate until null pointer
-            out.append(cmarkgfm.cmark_node_next(out[-1]))
+            out.append(bindings.cmark_node_next(out[-1]))
         return tuple(out[:-1])
 
     @classmethod
     def _position(cls, node):
-        return TypedTree.Build('position',
-                               r1=cmarkgfm.cmark_node_get_start_line(node),
-                               c1=cmarkgfm.cmark_node_get_start_column(node),
-                               r2=cmarkgfm.cmark_node_get_end_line(node),
-                               c2=cmarkgfm.cmark_node_get_end_column(node))
+        return POSITION(bindings.cmark_node_get_start_line(node),
+                        bindings.cmark_node_get_start_column(node),
+                        bindings.cmark_node_get_end_line(node),
+                        bindings.cmark_node_get_end_column(node))
 
     @classmethod
-    def _toAST(cls, node, children=None, **attr):
-        tag = cmarkgfm.cmark_node_get_type_string(node).decode()
+    def _attributes(cls, node, tag):
+        """Fields of a node other than children"""
+        attr = {'position': cls._position(node)}
+        if tag in LITERAL_TAGS:
+            attr['Text'] = bindings.cmark_node_get_literal(node).decode()
+        if tag == 'heading':
+            attr['Level'] = bindings.cmark_node_get_heading_level(node)
+        elif tag == 'code_block':
+            attr['Info'] = bindings.cmark_node_get_fence_info(node).decode()
+        elif tag in {'link', 'image'}:
+            attr['Destination'] = bindings.cmark_node_get_url(node).decode()
+            attr['Title'] = bindings.cmark_node_get_title(node).decode()
+        elif tag == 'list':
+            attr['Type'] = LIST_TYPES[bindings.cmark_node_get_list_type(node)]
+            attr['Tight'] = bindings.cmark_node_get_list_tight(node) != 0
+            if attr['Type'] == 'Ordered':
+                attr['Start'] = bindings.cmark_node_get_list_start(node)
+                attr['Delim'] = LIST_DELIMS[bindings.cmark_node_get_list_delim(node)]
+        elif tag == 'table_cell':
+            attr['Alignment'] = cls._alignment(node)
+        return attr
+
+    @staticmethod
+    def _alignment(cell):
+        column = 0
+        prev = bindings.cmark_node_previous(cell)
+        while prev:
+            column += 1
+            prev = bindings.cmark_node_previous(prev)
+        table = bindings.cmark_node_parent(bindings.cmark_node_parent(cell))
+        if column >= bindings.cmark_gfm_extensions_get_table_columns(table):
+            return 'Left'
+        align = bindings.cmark_gfm_extensions_get_table_alignments(table)
+        return ALIGNMENTS.get(align[column].decode(), 'Left')
+
+
+class ASTBuilder(object):
+    """Node constructor shared by the AST generation paths of CmarkDocument.toAST
+
+    Nodes are built bottom-up, so with packed positions a node's pos is its
+    index in postorder.  Packed literals are only possible when decoding a
+    flat record buffer, whose string pool is kept by the Document; a literal
+    node's lit is its index in postorder among literal nodes.  Field names
+    and values always come from the decoders, so nodes are built with the
+    trusted TypedTree constructors.  With an interner each node is replaced
+    by its canonical instance as soon as it is built.
+    """
+
+    def __init__(self, positions='node', literals='copy', intern=None):
+        if positions not in {'node', 'packed', None}:
+            raise ValueError("Invalid positions mode: {!r}".format(positions))
+        if literals not in {'copy', 'packed'}:
+            raise ValueError("Invalid literals mode: {!r}".format(literals))
+        self.positions = positions
+        self.literals = literals
+        self.intern = intern
+        self.table = array('i')  # packed (r1, c1, r2, c2) for each node
+        self.spans = array('i')  # packed (offset, length) in pool for each literal node
+        self.pool = b''
+
+    def literal(self, attr, pool, offset, length):
+        """Add the text of a literal node at offset in the string pool to its fields"""
+        if self.literals == 'packed':
+            self.pool = pool
+            attr['lit'] = len(self.spans) // 2
+            self.spans.extend((offset, length))
+        else:
+            attr['Text'] = pool[offset:offset+length].decode()
+
+    def __call__(self, tag, position, children, **attr):
+        if self.positions == 'node':
+            attr['position'] = POSITION(*position)
+        elif self.positions == 'packed':
+            attr['pos'] = len(self.table) // 4
+            self.table.extend(position)
+        attr['children'] = tuple(children)
+        node = TypedTree.Trusted(tag, tuple(attr))(*attr.values())
+        return node if self.intern is None else self.intern(node)
 
-        if tag == 'table' and children is None:
-            return cls._tableToAST(node)
-        elif tag == 'list' and len(attr) == 0:
-            return cls._listToAST(node)
+    def maker(self, tag, keys):
+        """Constructor make(r1, c1, r2, c2, children, *values) for tag nodes with the attributes in keys
 
-        if children is None:
-            children = [cls._toAST(c) for c in cls._children(node)]
+        Used by the compiled accessor module, which looks a constructor up
+        once per node shape and then passes values positionally.
+        """
+        fields = tuple(keys) + ('children',)
+        if self.positions == 'node':
+            make = TypedTree.Trusted(tag, fields + ('position',))
+            build = lambda r1, c1, r2, c2, children, *values: make(*(values + (children, POSITION(r1, c1, r2, c2))))
+        elif self.positions == 'packed':
+            make, table = TypedTree.Trusted(tag, fields + ('pos',)), self.table
+            def build(r1, c1, r2, c2, children, *values):
+                table.extend((r1, c1, r2, c2))
+                return make(*(values + (children, len(table) // 4 - 1)))
+        else:
+            make = TypedTree.Trusted(tag, fields)
+            build = lambda r1, c1, r2, c2, children, *values: make(*(values + (children,)))
+        if self.intern is None:
+            return build
+        intern = self.intern
+        return lambda *args: intern(build(*args))
 
-        if tag in {'text', 'code_block', 'code', 'html_block', 'html_inline', 'latex_block', 'latex_inline'}:
-            attr['Text'] = cmarkgfm.cmark_node_get_literal(node).decode()
+    def document(self, nodes):
+        fields = {'nodes': tuple(nodes)}
+        if self.positions == 'packed':
+            fields['positions'] = self.table.tobytes()
+        if self.literals == 'packed':
+            fields['literals'] = self.spans.tobytes()
+            fields['pool'] = self.pool
+        doc = TypedTree.Trusted('Document', tuple(fields))(*fields.values())
+        return doc if self.intern is None else self.intern(doc)
+
+
+class NodeView(TypedTree.TT):
+    """Base class for views with the read interface of a TypedTree AST node
+
+    Subclasses set _tag and _fields and implement _decode(name), which is
+    called the first time a field is accessed; the value is then cached.
+    """
+
+    def __getattr__(self, name):
+        # only called when normal lookup fails, so private names are never fields
+        if name.startswith('_') or name not in self._fields:
+            raise AttributeError("{!r} node has no field {!r}".format(self._tag, name))
+        if name not in self._values:
+            self._values[name] = self._decode(name)
+        return self._values[name]
+
+    def __iter__(self):
+        return (getattr(self, k) for k in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self)[i]
+        return getattr(self, self._fields[i])
+
+
+class CmarkNodeView(NodeView):
+    """Lazy view of a native node with the read interface of a TypedTree AST node
+
+    Fields are the same as in the AST generated by CmarkDocument.toAST, but
+    children and attributes are decoded from the native node the first time
+    they are accessed and then cached.
+    """
+
+    def __init__(self, document, node, tag=None):
+        self._document = document  # keeps native tree alive
+        self._node = node
+        self._tag = tag if tag is not None else bindings.cmark_node_get_type_string(node).decode()
+        self._fields = self._nodeFields()
+        self._values = {}
+
+    def _nodeFields(self):
+        tag = self._tag
+        if tag == 'Document':
+            return ('nodes',)
+        attr = ['children', 'position']
+        if tag in LITERAL_TAGS:
+            attr.append('Text')
         if tag == 'heading':
-            attr['Level'] = cmarkgfm.cmark_node_get_heading_level(node)
-        if tag == 'code_block':
-            attr['Info'] = cmarkgfm.cmark_node_get_fence_info(node).decode()
-        if tag in {'link', 'image'}:
-            attr['Destination'] = cmarkgfm.cmark_node_get_url(node).decode()
-            attr['Title'] = cmarkgfm.cmark_node_get_title(node).decode()
+            attr.append('Level')
+        elif tag == 'code_block':
+            attr.append('Info')
+        elif tag in {'link', 'image'}:
+            attr += ['Destination', 'Title']
+        elif tag == 'list':
+            attr += ['Type', 'Tight']
+            if LIST_TYPES[bindings.cmark_node_get_list_type(self._live())] == 'Ordered':
+                attr += ['Start', 'Delim']
+        elif tag == 'table_cell':
+            attr.append('Alignment')
+        return tuple(sorted(attr))
 
-        return TypedTree.Build(tag, position=cls._position(node), children=children, **attr)
+    def _live(self):
+        self._document._root  # raises if document has been closed
+        return self._node
 
-    @classmethod
-    def _listToAST(cls, node):
-        attr = {
-            'Type': ['None', 'Bullet', 'Ordered'][cmarkgfm.cmark_node_get_list_type(node)],
-            'Tight': cmarkgfm.cmark_node_get_list_tight(node) != 0
-        }
-        if attr['Type'] == 'Ordered':
-            attr['Start'] = cmarkgfm.cmark_node_get_list_start(node)
-            attr['Delim'] = ["None", "Period", "Paren"][cmarkgfm.cmark_node_get_list_delim(node)]
-        return cls._toAST(node, **attr)
+    ##### FIELD DECODING #####
 
-    @classmethod
-    def _tableToAST(cls, node):
-        align = cmarkgfm.cmark_gfm_extensions_get_table_alignments(node)
-        rows = []
-        for tr in cls._children(node):
-            cols = []
-            for td, a in zip(cls._children(tr), align):
-                cols.append(cls._toAST(td, Alignment={'l': "Left", 'c': "Center", 'r': "Right"}.get(a,'Left')))
-            rows.append(cls._toAST(tr, children=cols))
-        return cls._toAST(node, children=rows)
\ No newline at end of file
+    def _decode(self, name):
+        node = self._live()
+        if name in {'nodes', 'children'}:
+            return tuple([CmarkNodeView(self._document, c) for c in CmarkDocument._children(node)])
+        elif name == 'position':
+            return CmarkDocument._position(node)
+        elif name == 'Text':
+            return bindings.cmark_node_get_literal(node).decode()
+        elif name == 'Level':
+            return bindings.cmark_node_get_heading_level(node)
+        elif name == 'Info':
+            return bindings.cmark_node_get_fence_info(node).decode()
+        elif name == 'Destination':
+            return bindings.cmark_node_get_url(node).decode()
+        elif name == 'Title':
+            return bindings.cmark_node_get_title(node).decode()
+        elif name == 'Type':
+            return LIST_TYPES[bindings.cmark_node_get_list_type(node)]
+        elif name == 'Tight':
+            return bindings.cmark_node_get_list_tight(node) != 0
+        elif name == 'Start':
+            return bindings.cmark_node_get_list_start(node)
+        elif name == 'Delim':
+            return LIST_DELIMS[bindings.cmark_node_get_list_delim(node)]
+        elif name == 'Alignment':
+            return CmarkDocument._alignment(node)
+
+
+class ShiftedNode(NodeView):
+    """View of an AST node whose source lines are shifted by delta
+
+    CmarkDocument.reparse wraps the blocks after an edit that changes the
+    line count, so they aren't rebuilt.  Positions are shifted and children
+    wrapped the first time they are accessed; a view of a view shifts the
+    underlying node by the sum of both deltas.
+    """
+
+    def __init__(self, node, delta):
+        if isinstance(node, ShiftedNode):
+            node, delta = node._node, node._delta + delta
+        self._node = node
+        self._delta = delta
+        self._tag = node._tag
+        self._fields = node._fields
+        self._values = {}
+
+    def _decode(self, name):
+        value = getattr(self._node, name)
+        if name == 'position':
+            return value._replace(r1=value.r1+self._delta, r2=value.r2+self._delta)
+        elif name == 'children':
+            return tuple([ShiftedNode(c, self._delta) for c in value])
+        return value
+
+
+class SourceLines(list):
+    """Source lines of a document edited with CmarkDocument.reparse
+
+    definitions caches whether the lines define link references, so edits
+    only have to scan the reparsed region.
+    """
+
+    def __init__(self, lines=()):
+        list.__init__(self, lines)
+        self.definitions = REFERENCE_DEFINITION.search('\n'.join(self)) is not None
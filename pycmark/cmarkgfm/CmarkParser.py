@@ -0,0 +1,123 @@
+import ctypes
+import threading
+import weakref
+from . import bindings
+from .CmarkDocument import CmarkDocument
+
+# size of chunks read from files or copied out of read-only buffers
+CHUNK_SIZE = 1 << 16
+
+
+class CmarkParser(object):
+    """Reusable parser handle with syntax extensions attached once
+
+    A parser resets itself after each document, so one handle can parse any
+    number of documents.  A handle must not be used from more than one thread
+    at a time; default() provides one handle per thread.  Handles own their
+    options and allocator, so handles on different threads parse concurrently.
+
+    Documents can be parsed in one call (parse) or incrementally by feeding
+    chunks and then calling finish.  Chunks may split lines or multi-byte
+    characters anywhere.
+    """
+    _local = threading.local()
+
+    def __init__(self, options=None):
+        mem = bindings.cmark_get_default_mem_allocator()
+        self._options = options  # also used to render the parsed documents
+        if options is None:
+            self._parser = bindings.get_parser_with_mem(mem)
+        else:
+            self._parser = bindings.get_parser_with_options(options, mem)
+        self._finalizer = weakref.finalize(self, bindings.cmark_parser_free, self._parser)
+
+    @classmethod
+    def default(cls):
+        """Parser handle shared by parse calls on the current thread"""
+        if getattr(cls._local, 'parser', None) is None:
+            cls._local.parser = cls()
+        return cls._local.parser
+
+    def parse(self, txt, encoding='utf_8'):
+        """Parse markdown and return a CmarkDocument"""
+        if not isinstance(txt, bytes):
+            txt = txt.encode(encoding=encoding)
+        self.feed(txt)
+        return self.finish()
+
+    def parseFile(self, f, encoding='utf_8', chunk_size=CHUNK_SIZE):
+        """Parse markdown from a file object (binary or text) in chunks"""
+        self.feedFile(f, encoding=encoding, chunk_size=chunk_size)
+        return self.finish()
+
+    def parseChunks(self, chunks, encoding='utf_8'):
+        """Parse markdown from an iterable of str or bytes-like chunks"""
+        for chunk in chunks:
+            self.feed(chunk, encoding=encoding)
+        return self.finish()
+
+    def feed(self, data, length=None, encoding='utf_8'):
+        """Feed a chunk of markdown to the parser
+
+        data may be a str or any bytes-like object (bytes, bytearray, memoryview,
+        mmap, ...).  Only the first length bytes are fed if length is given.
+        Writable buffers are passed to the parser without copying.
+        """
+        if isinstance(data, str):
+            data = data.encode(encoding=encoding)
+        if isinstance(data, bytes):
+            n = len(data) if length is None else min(length, len(data))
+            bindings.cmark_parser_feed(self._root, data, n)
+            return
+        with memoryview(data) as base, base.cast('B') as flat, flat[:length] as view:
+            if not view.readonly:
+                buf = (ctypes.c_char * len(view)).from_buffer(view)
+                bindings.cmark_parser_feed(self._root, buf, len(view))
+                del buf  # release buffer export before the views are released
+            else:
+                for i in range(0, len(view), CHUNK_SIZE):
+                    chunk = view[i:i+CHUNK_SIZE].tobytes()
+                    bindings.cmark_parser_feed(self._root, chunk, len(chunk))
+
+    def feedFile(self, f, encoding='utf_8', chunk_size=CHUNK_SIZE):
+        """Feed the contents of a file object to the parser in chunks"""
+        if hasattr(f, 'readinto'):  # binary file: reuse a single buffer
+            buf = bytearray(chunk_size)
+            n = f.readinto(buf)
+            while n:
+                self.feed(buf, length=n)
+                n = f.readinto(buf)
+        else:
+            chunk = f.read(chunk_size)
+            while chunk:
+                self.feed(chunk, encoding=encoding)
+                chunk = f.read(chunk_size)
+
+    def finish(self):
+        """Finish the current document and reset the parser for the next one"""
+        if hasattr(bindings, 'parser_finish'):  # resets per-thread extension state
+            return CmarkDocument.fromNode(bindings.parser_finish(self._root), self._options)
+        return CmarkDocument.fromNode(bindings.cmark_parser_finish(self._root), self._options)
+
+    ##### LIFECYCLE #####
+
+    def close(self):
+        """Release the native parser (also done when the object is garbage collected)"""
+        self._finalizer()
+        self._parser = None
+
+    @property
+    def closed(self):
+        return self._parser is None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def _root(self):
+        if self._parser is None:
+            raise ValueError("Operation on a closed CmarkParser")
+        return self._parser
@@ -1,19 +1,101 @@
-import os
-import subprocess
-from . import cmarkgfm
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from . import bindings
 from .CmarkDocument import CmarkDocument
+from .CmarkParser import CmarkParser
 
+# target size in characters of the shards parsed by parseSharded
+SHARD_SIZE = 1 << 20
 
-def mdToLatex(txt):
+
+def __getattr__(name):
+    """Import the full generated ctypes module only when it is asked for"""
+    if name == 'cmarkgfm':
+        return importlib.import_module('.cmarkgfm', __name__)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def mdToLatex(txt, encoding='utf_8'):
     """Convert markdown to latex"""
-    P = subprocess.Popen([os.path.join(os.path.dirname(__file__), 'bin', 'gfm'), '--latex', '-'],
-                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-    stdout, stderr = P.communicate(txt.encode())
-    return stdout
+    with parse(txt, encoding=encoding) as doc:
+        return doc.toLatex()
+
+def mdToLatexMany(txts, encoding='utf_8', workers=1):
+    """Convert an iterable of markdown documents to a list of latex documents
+
+    Documents are converted on a pool of workers threads if workers is not 1
+    (None for one thread per core).
+    """
+    def convert(parser, txt):
+        with parser.parse(txt, encoding=encoding) as doc:
+            return doc.toLatex()
+    return _mapParsers(convert, txts, workers)
+
+def parseMany(txts, workers=None, options=None, encoding='utf_8'):
+    """Parse an iterable of markdown documents on a thread pool
+
+    Each worker thread uses its own parser, created with the given cmark
+    options (library defaults if None).  Returns a list of CmarkDocuments in
+    input order.
+    """
+    return _mapParsers(lambda parser, txt: parser.parse(txt, encoding=encoding), txts, workers, options)
+
+def parseSharded(txt, workers=None, shard_size=SHARD_SIZE, options=None, encoding='utf_8'):
+    """Parse a large markdown document in shards on a thread pool and return its AST
+
+    The source is split at top-level block boundaries (see
+    CmarkDocument.shardSource), the shards are parsed concurrently and their
+    ASTs are joined with corrected line numbers.  The result is the same as
+    parse(txt).toAST(); the whole document is parsed instead if it can't be
+    split safely.
+    """
+    if isinstance(txt, bytes):
+        txt = txt.decode(encoding)
+    shards = CmarkDocument.shardSource(txt, shard_size)
+    if len(shards) > 1:
+        def convert(parser, shard):
+            with parser.parse(shard[1]) as doc:
+                return shard[0], doc.toAST()
+        tt = CmarkDocument.stitch(_mapParsers(convert, shards, workers, options))
+        if tt is not None:
+            return tt
+    parser = CmarkParser.default() if options is None else CmarkParser(options=options)
+    with parser.parse(txt) as doc:
+        return doc.toAST()
+
+def _mapParsers(fn, txts, workers, options=None):
+    """Map fn(parser, txt) over txts with one parser handle per thread"""
+    if workers == 1:
+        parser = CmarkParser.default() if options is None else CmarkParser(options=options)
+        return [fn(parser, txt) for txt in txts]
+    local = threading.local()
+    def run(txt):
+        if getattr(local, 'parser', None) is None:
+            local.parser = CmarkParser(options=options)
+        return fn(local.parser, txt)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run, txts))
 
 def parse(txt, encoding='utf_8'):
     """Parse markdown and return a CmarkDocument"""
-    return CmarkDocument(txt, encoding=encoding)
+    return CmarkParser.default().parse(txt, encoding=encoding)
+
+def outline(txt, encoding='utf_8'):
+    """Parse markdown and return (level, text, line) for each top-level heading"""
+    with parse(txt, encoding=encoding) as doc:
+        return doc.outline()
+
+def parseFile(f, encoding='utf_8'):
+    """Parse markdown from a file name or file object without reading it into memory first"""
+    if isinstance(f, str):
+        with open(f, 'rb') as F:
+            return CmarkParser.default().parseFile(F)
+    return CmarkParser.default().parseFile(f, encoding=encoding)
+
+def parseChunks(chunks, encoding='utf_8'):
+    """Parse markdown from an iterable of str or bytes-like chunks"""
+    return CmarkParser.default().parseChunks(chunks, encoding=encoding)
 
 # attach extensions and perform startup tasks
-cmarkgfm.startup()
\ No newline at end of file
+bindings.startup()
\ No newline at end of file
@@ -0,0 +1,317 @@
+/*
+ * Compiled node accessors for pycmark.cmarkgfm
+ *
+ * Converts a native node subtree directly into Python objects, avoiding the
+ * per-getter ctypes marshalling of the pure Python AST generation.  cmark
+ * symbols are left undefined and resolved against gfm.so, which the Python
+ * bindings load with RTLD_GLOBAL before importing this module.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+#include <string.h>
+
+#include "cmark-gfm.h"
+#include "cmark-gfm-core-extensions.h"
+
+static const char *list_types[] = {"None", "Bullet", "Ordered"};
+static const char *list_delims[] = {"None", "Period", "Paren"};
+
+// node types with a literal (must match LITERAL_TAGS in CmarkDocument.py)
+static const char *literal_tags[] = {
+    "text", "code_block", "code", "html_block", "html_inline", "latex_block", "latex_inline", NULL
+};
+
+static int has_literal(const char *tag) {
+    for (int i = 0; literal_tags[i] != NULL; i++) {
+        if (strcmp(tag, literal_tags[i]) == 0) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+// most attributes of a node: Type, Tight, Start and Delim of an ordered list
+#define MAX_ATTRIBUTES 4
+
+// node fields other than position and children, in the order passed to the node constructors
+typedef struct {
+    int n;
+    const char *keys[MAX_ATTRIBUTES];
+    PyObject *values[MAX_ATTRIBUTES];
+} attributes;
+
+static int add_value(attributes *attr, const char *key, PyObject *value) {
+    if (value == NULL) {
+        return -1;
+    }
+    attr->keys[attr->n] = key;
+    attr->values[attr->n++] = value;
+    return 0;
+}
+
+static int add_string(attributes *attr, const char *key, const char *value) {
+    return add_value(attr, key, PyUnicode_FromString(value != NULL ? value : ""));
+}
+
+static int add_long(attributes *attr, const char *key, long value) {
+    return add_value(attr, key, PyLong_FromLong(value));
+}
+
+static int add_bool(attributes *attr, const char *key, int value) {
+    PyObject *b = value ? Py_True : Py_False;
+    Py_INCREF(b);
+    return add_value(attr, key, b);
+}
+
+static void clear_attributes(attributes *attr) {
+    for (int i = 0; i < attr->n; i++) {
+        Py_DECREF(attr->values[i]);
+    }
+    attr->n = 0;
+}
+
+static const char *cell_alignment(cmark_node *cell) {
+    int column = 0;
+    for (cmark_node *prev = cmark_node_previous(cell); prev != NULL; prev = cmark_node_previous(prev)) {
+        column++;
+    }
+    cmark_node *table = cmark_node_parent(cmark_node_parent(cell));
+    if (table == NULL || column >= cmark_gfm_extensions_get_table_columns(table)) {
+        return "Left";
+    }
+    switch (cmark_gfm_extensions_get_table_alignments(table)[column]) {
+        case 'c': return "Center";
+        case 'r': return "Right";
+        default:  return "Left";
+    }
+}
+
+// node fields other than position and children (same keys as the Python AST)
+static int node_attributes(cmark_node *node, const char *tag, attributes *attr) {
+    int rc = 0;
+    if (has_literal(tag)) {
+        rc |= add_string(attr, "Text", cmark_node_get_literal(node));
+    }
+    if (strcmp(tag, "heading") == 0) {
+        rc |= add_long(attr, "Level", cmark_node_get_heading_level(node));
+    } else if (strcmp(tag, "code_block") == 0) {
+        rc |= add_string(attr, "Info", cmark_node_get_fence_info(node));
+    } else if (strcmp(tag, "link") == 0 || strcmp(tag, "image") == 0) {
+        rc |= add_string(attr, "Destination", cmark_node_get_url(node));
+        rc |= add_string(attr, "Title", cmark_node_get_title(node));
+    } else if (strcmp(tag, "list") == 0) {
+        cmark_list_type type = cmark_node_get_list_type(node);
+        rc |= add_string(attr, "Type", list_types[type]);
+        rc |= add_bool(attr, "Tight", cmark_node_get_list_tight(node));
+        if (type == CMARK_ORDERED_LIST) {
+            rc |= add_long(attr, "Start", cmark_node_get_list_start(node));
+            rc |= add_string(attr, "Delim", list_delims[cmark_node_get_list_delim(node)]);
+        }
+    } else if (strcmp(tag, "table_cell") == 0) {
+        rc |= add_string(attr, "Alignment", cell_alignment(node));
+    }
+    if (rc != 0) {
+        clear_attributes(attr);
+        return -1;
+    }
+    return 0;
+}
+
+// Node constructors from builder.maker(tag, keys), looked up once per node
+// shape.  Type strings are static, so tags are compared by address, and the
+// keys of a tag only vary in number (ordered lists have Start and Delim).
+#define MAX_SHAPES 64
+
+typedef struct {
+    PyObject *builder;
+    int n;
+    struct {
+        const char *tag;
+        int n_keys;
+        PyObject *make;
+    } shapes[MAX_SHAPES];
+} makers;
+
+static PyObject *get_maker(makers *m, const char *tag, attributes *attr) {
+    for (int i = 0; i < m->n; i++) {
+        if (m->shapes[i].tag == tag && m->shapes[i].n_keys == attr->n) {
+            return m->shapes[i].make;
+        }
+    }
+    if (m->n == MAX_SHAPES) {
+        PyErr_SetString(PyExc_RuntimeError, "Too many node shapes");
+        return NULL;
+    }
+    PyObject *keys = PyTuple_New(attr->n);
+    if (keys == NULL) {
+        return NULL;
+    }
+    for (int i = 0; i < attr->n; i++) {
+        PyObject *key = PyUnicode_FromString(attr->keys[i]);
+        if (key == NULL) {
+            Py_DECREF(keys);
+            return NULL;
+        }
+        PyTuple_SET_ITEM(keys, i, key);
+    }
+    PyObject *make = PyObject_CallMethod(m->builder, "maker", "sO", tag, keys);
+    Py_DECREF(keys);
+    if (make == NULL) {
+        return NULL;
+    }
+    m->shapes[m->n].tag = tag;
+    m->shapes[m->n].n_keys = attr->n;
+    m->shapes[m->n].make = make;  // reference released by clear_makers
+    m->n++;
+    return make;
+}
+
+static void clear_makers(makers *m) {
+    for (int i = 0; i < m->n; i++) {
+        Py_DECREF(m->shapes[i].make);
+    }
+    m->n = 0;
+}
+
+// call fn with positional arguments, without an argument tuple where vectorcall is available
+static PyObject *call_positional(PyObject *fn, PyObject **args, Py_ssize_t n) {
+#if PY_VERSION_HEX >= 0x03090000
+    return PyObject_Vectorcall(fn, args, n, NULL);
+#else
+    PyObject *tuple = PyTuple_New(n);
+    if (tuple == NULL) {
+        return NULL;
+    }
+    for (Py_ssize_t i = 0; i < n; i++) {
+        Py_INCREF(args[i]);
+        PyTuple_SET_ITEM(tuple, i, args[i]);
+    }
+    PyObject *result = PyObject_Call(fn, tuple, NULL);
+    Py_DECREF(tuple);
+    return result;
+#endif
+}
+
+// call make(r1, c1, r2, c2, children, *values) for the node's shape and append the result to the open child list
+static int append_node(PyObject *stack, makers *m, cmark_node *node, PyObject *children) {
+    const char *tag = cmark_node_get_type_string(node);
+    attributes attr = {0};
+    if (node_attributes(node, tag, &attr) < 0) {
+        return -1;
+    }
+    PyObject *make = get_maker(m, tag, &attr);
+    PyObject *args[5 + MAX_ATTRIBUTES];
+    args[0] = PyLong_FromLong(cmark_node_get_start_line(node));
+    args[1] = PyLong_FromLong(cmark_node_get_start_column(node));
+    args[2] = PyLong_FromLong(cmark_node_get_end_line(node));
+    args[3] = PyLong_FromLong(cmark_node_get_end_column(node));
+    args[4] = children;
+    for (int i = 0; i < attr.n; i++) {
+        args[5 + i] = attr.values[i];
+    }
+    PyObject *built = NULL;
+    if (make != NULL && args[0] != NULL && args[1] != NULL && args[2] != NULL && args[3] != NULL) {
+        built = call_positional(make, args, 5 + attr.n);
+    }
+    for (int i = 0; i < 4; i++) {
+        Py_XDECREF(args[i]);
+    }
+    clear_attributes(&attr);
+    if (built == NULL) {
+        return -1;
+    }
+    PyObject *siblings = PyList_GET_ITEM(stack, PyList_GET_SIZE(stack) - 1);
+    int rc = PyList_Append(siblings, built);
+    Py_DECREF(built);
+    return rc;
+}
+
+// close the most recently opened node: pop its child list and build it
+static int close_node(PyObject *stack, makers *m, cmark_node *node) {
+    Py_ssize_t n = PyList_GET_SIZE(stack);
+    PyObject *children = PyList_AsTuple(PyList_GET_ITEM(stack, n - 1));
+    if (children == NULL || PyList_SetSlice(stack, n - 1, n, NULL) < 0) {
+        Py_XDECREF(children);
+        return -1;
+    }
+    int rc = append_node(stack, m, node, children);
+    Py_DECREF(children);
+    return rc;
+}
+
+static int open_node(PyObject *stack) {
+    PyObject *children = PyList_New(0);
+    if (children == NULL) {
+        return -1;
+    }
+    int rc = PyList_Append(stack, children);
+    Py_DECREF(children);
+    return rc;
+}
+
+PyDoc_STRVAR(build_children_doc,
+"build_children(address, builder) -> tuple\n\n"
+"Build the children of the node at address with make(r1, c1, r2, c2, children, *values),\n"
+"where make = builder.maker(tag, keys) is looked up once per node shape and values are the\n"
+"node's attributes in the order of keys.  Descendants are built bottom-up without recursion.");
+
+static PyObject *build_children(PyObject *Py_UNUSED(self), PyObject *args) {
+    unsigned long long address;
+    makers m = {0};
+    if (!PyArg_ParseTuple(args, "KO:build_children", &address, &m.builder)) {
+        return NULL;
+    }
+    cmark_node *root = (cmark_node *)(uintptr_t)address;
+    PyObject *empty = PyTuple_New(0);
+    PyObject *stack = PyList_New(0);  // child list for root and each open node
+    PyObject *result = NULL;
+    if (empty == NULL || stack == NULL || open_node(stack) < 0) {
+        goto done;
+    }
+
+    cmark_node *node = cmark_node_first_child(root);
+    while (node != NULL) {
+        cmark_node *child = cmark_node_first_child(node);
+        if (child != NULL) {
+            if (open_node(stack) < 0) {
+                goto done;
+            }
+            node = child;
+            continue;
+        }
+        if (append_node(stack, &m, node, empty) < 0) {
+            goto done;
+        }
+        // close finished ancestors, then continue with the next sibling
+        while (node != root && cmark_node_next(node) == NULL) {
+            node = cmark_node_parent(node);
+            if (node != root && close_node(stack, &m, node) < 0) {
+                goto done;
+            }
+        }
+        node = node == root ? NULL : cmark_node_next(node);
+    }
+    result = PyList_AsTuple(PyList_GET_ITEM(stack, 0));
+
+done:
+    clear_makers(&m);
+    Py_XDECREF(empty);
+    Py_XDECREF(stack);
+    return result;
+}
+
+static PyMethodDef accessors_methods[] = {
+    {"build_children", build_children, METH_VARARGS, build_children_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef accessors_module = {
+    PyModuleDef_HEAD_INIT, "accessors", "Compiled node accessors for pycmark.cmarkgfm", -1, accessors_methods,
+    NULL, NULL, NULL, NULL
+};
+
+PyMODINIT_FUNC PyInit_accessors(void) {
+    return PyModule_Create(&accessors_module);
+}
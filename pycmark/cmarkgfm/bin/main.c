@@ -3,9 +3,12 @@
 #include <string.h>
 
 #include "parser.h"
+#include "chunk.h"
 #include "render.h"
 #include "registry.h"
 #include "houdini.h"
+#include "inlines.h"
+#include "syntax_extension.h"
 #include "cmark-gfm.h"
 #include "cmark-gfm-core-extensions.h"
 
@@ -20,7 +23,7 @@
  * Configuration
  */
 
-// rendering options
+// default parsing and rendering options (read-only once parsers are in use)
 int options = CMARK_OPT_DEFAULT \
     | CMARK_OPT_SOURCEPOS  // include line numbers in output
     | CMARK_OPT_UNSAFE;    // allow raw html
@@ -50,9 +53,10 @@ static cmark_node* node_from_text(cmark_syntax_extension *ext, cmark_parser *par
     node->end_column = cmark_inline_parser_get_column(inline_parser);
 
     // copy text from inline parser into node
+    cmark_chunk *chunk = cmark_inline_parser_get_chunk(inline_parser);
     cmark_strbuf buf;
     cmark_strbuf_init(parser->mem, &buf, stop - start);
-    for (int i = start; i < stop; i++) cmark_strbuf_putc(&buf, cmark_inline_parser_peek_at(inline_parser, i));
+    cmark_strbuf_put(&buf, chunk->data + start, stop - start);
     cmark_node_set_literal(node, cmark_strbuf_cstr(&buf));
     cmark_strbuf_free(&buf);
 
@@ -73,6 +77,53 @@ static bool parser_strcmp(cmark_inline_parser *inline_parser, int offset, const
     return true;
 }
 
+// Result of the last closing delimiter search.  A search from position p that
+// finds the closer at c (or no closer) answers every later search from a
+// position in [p, c] (or after p), so openers without a closer don't each
+// rescan the rest of the paragraph.  Only valid during one cmark_parser_finish
+// call.  Extensions are shared by all parsers, so the caches can't live in
+// their private data; a document is finished on a single thread, so each
+// thread has its own caches and parser_finish resets them for every document.
+typedef struct {
+    cmark_node *parent;         // container whose inlines are being parsed
+    const unsigned char *data;  // text of the container
+    bufsize_t from;             // start of the last search
+    bufsize_t closer;           // closer position found by the last search (-1 if none)
+} closer_cache;
+
+static _Thread_local closer_cache b_latex_closer;
+static _Thread_local closer_cache i_latex_closer;
+
+static void reset_closers(void) {
+    memset(&b_latex_closer, 0, sizeof(closer_cache));
+    memset(&i_latex_closer, 0, sizeof(closer_cache));
+}
+
+// position of the first closing delimiter at or after from, or -1
+static bufsize_t find_closer(closer_cache *cache, cmark_node *parent, cmark_inline_parser *inline_parser, bufsize_t from, const char *closer) {
+    cmark_chunk *chunk = cmark_inline_parser_get_chunk(inline_parser);
+    if (cache->parent == parent && cache->data == chunk->data && from >= cache->from
+            && (cache->closer < 0 || from <= cache->closer)) {
+        return cache->closer;
+    }
+    size_t n = strlen(closer);
+    const unsigned char *p = chunk->data + from;
+    const unsigned char *end = chunk->data + chunk->len;
+    bufsize_t found = -1;
+    while (p + n <= end && (p = memchr(p, closer[0], end - p - n + 1)) != NULL) {
+        if (memcmp(p, closer, n) == 0) {
+            found = (bufsize_t)(p - chunk->data);
+            break;
+        }
+        p++;
+    }
+    cache->parent = parent;
+    cache->data = chunk->data;
+    cache->from = from;
+    cache->closer = found;
+    return found;
+}
+
 static void rewind_node(cmark_node *container, int n) {
     cmark_node_unput(container, n);
     cmark_node *prev = cmark_node_last_child(container);
@@ -150,12 +201,11 @@ static void cmark_render_i_latex(cmark_syntax_extension *extension, cmark_render
 static cmark_node *match_b_latex(cmark_syntax_extension *self, cmark_parser *parser,
         cmark_node *parent, unsigned char character, cmark_inline_parser *inline_parser) {
     if (character == '$' && parser_strcmp(inline_parser, 0, "$$")) {
-        for (int cur_offset = 2; cmark_inline_parser_peek_at(inline_parser, cur_offset) != '\x00'; cur_offset++) {
-            if (parser_strcmp(inline_parser, cur_offset, "$$")) {
-                int base_offset = cmark_inline_parser_get_offset(inline_parser);
-                cmark_inline_parser_set_offset(inline_parser, base_offset + cur_offset + 2);
-                return node_from_text(self, parser, inline_parser, base_offset + 2, base_offset + cur_offset);
-            }
+        int base_offset = cmark_inline_parser_get_offset(inline_parser);
+        bufsize_t closer = find_closer(&b_latex_closer, parent, inline_parser, base_offset + 2, "$$");
+        if (closer >= 0) {
+            cmark_inline_parser_set_offset(inline_parser, closer + 2);
+            return node_from_text(self, parser, inline_parser, base_offset + 2, closer);
         }
     }
     return NULL;
@@ -163,14 +213,13 @@ static cmark_node *match_b_latex(cmark_syntax_extension *self, cmark_parser *par
 
 static cmark_node *match_i_latex(cmark_syntax_extension *self, cmark_parser *parser,
         cmark_node *parent, unsigned char character, cmark_inline_parser *inline_parser) {
-    if (character == '(' && parser_strcmp(inline_parser, -2, "\\\\(")) {
-        for (int cur_offset = 3; cmark_inline_parser_peek_at(inline_parser, cur_offset) != '\x00'; cur_offset++) {
-            if (parser_strcmp(inline_parser, cur_offset, "\\\\)")) {
-                rewind_node(parent, 1);  // remove leading backslash from parent
-                int base_offset = cmark_inline_parser_get_offset(inline_parser);
-                cmark_inline_parser_set_offset(inline_parser, base_offset + cur_offset + 3);
-                return node_from_text(self, parser, inline_parser, base_offset + 1, base_offset + cur_offset);
-            }
+    int base_offset = cmark_inline_parser_get_offset(inline_parser);
+    if (character == '(' && base_offset >= 2 && parser_strcmp(inline_parser, -2, "\\\\(")) {
+        bufsize_t closer = find_closer(&i_latex_closer, parent, inline_parser, base_offset + 3, "\\\\)");
+        if (closer >= 0) {
+            rewind_node(parent, 1);  // remove leading backslash from parent
+            cmark_inline_parser_set_offset(inline_parser, closer + 3);
+            return node_from_text(self, parser, inline_parser, base_offset + 1, closer);
         }
     }
     return NULL;
@@ -229,34 +278,94 @@ cmark_syntax_extension *create_latex_inline_extension(void) {
  * Application
  */
 
+static int latex_extensions_init(cmark_plugin *plugin) {
+    cmark_plugin_register_syntax_extension(plugin, create_latex_block_extension());
+    cmark_plugin_register_syntax_extension(plugin, create_latex_inline_extension());
+    return 1;
+}
+
+// syntax extensions attached to every parser, in attachment order
+static const char *extension_names[] = {
+    "autolink", "table", "strikethrough", "tagfilter", "tasklist", "latex_block", "latex_inline", NULL
+};
+
+// extension list looked up once at startup and shared by parsers and renderers
+static cmark_llist *syntax_extensions = NULL;
+
+static cmark_syntax_extension *find_extension(const char *name) {
+    cmark_syntax_extension *syntax_extension = cmark_find_syntax_extension(name);
+    if (!syntax_extension) {
+        fprintf(stderr, "Unknown extension %s\n", name);
+        exit(1);
+    }
+    return syntax_extension;
+}
+
+// Inline parsing looks special characters up in a table shared by all parsers.
+// cmark_parser_finish enables the characters of a parser's inline extensions
+// in it and clears them again once inlines are parsed, so finishing documents
+// on several threads at once would race.  Every parser attaches the same
+// extensions, so their characters are enabled once here and taken off the
+// extensions, which leaves cmark_parser_finish nothing to toggle.
+static void enable_special_characters(void) {
+    cmark_mem *mem = cmark_get_default_mem_allocator();
+    for (cmark_llist *ext = syntax_extensions; ext != NULL; ext = ext->next) {
+        cmark_syntax_extension *syntax_extension = (cmark_syntax_extension*)ext->data;
+        for (cmark_llist *c = syntax_extension->special_inline_chars; c != NULL; c = c->next) {
+            cmark_inlines_add_special_character((unsigned char)(size_t)c->data, syntax_extension->emphasis);
+        }
+        cmark_llist_free(mem, syntax_extension->special_inline_chars);
+        syntax_extension->special_inline_chars = NULL;
+    }
+}
+
 void startup(void) {
+    if (syntax_extensions != NULL) {
+        return;
+    }
     cmark_gfm_core_extensions_ensure_registered();
+    cmark_register_plugin(latex_extensions_init);  // released by cmark_release_plugins
+    cmark_mem *mem = cmark_get_default_mem_allocator();
+    for (int i = 0; extension_names[i] != NULL; i++) {
+        syntax_extensions = cmark_llist_append(mem, syntax_extensions, find_extension(extension_names[i]));
+    }
+    enable_special_characters();
 }
 
 void shutdown(void) {
+    cmark_llist_free(cmark_get_default_mem_allocator(), syntax_extensions);
+    syntax_extensions = NULL;
     cmark_release_plugins();
 }
 
 void attach_extension(cmark_parser *parser, const char *name) {
-    cmark_syntax_extension *syntax_extension = cmark_find_syntax_extension(name);
-    if (!syntax_extension) {
-        fprintf(stderr, "Unknown extension %s\n", name);
-        exit(1);
-    } else {
-        cmark_parser_attach_syntax_extension(parser, syntax_extension);
+    cmark_parser_attach_syntax_extension(parser, find_extension(name));
+}
+
+// a parser can be reused: cmark_parser_finish resets it and keeps its extensions
+cmark_parser* get_parser_with_options(int parser_options, cmark_mem *mem) {
+    cmark_parser *parser = cmark_parser_new_with_mem(parser_options, mem);
+    for (cmark_llist *ext = syntax_extensions; ext != NULL; ext = ext->next) {
+        cmark_parser_attach_syntax_extension(parser, (cmark_syntax_extension*)ext->data);
     }
+    return parser;
+}
+
+cmark_parser* get_parser_with_mem(cmark_mem *mem) {
+    return get_parser_with_options(options, mem);
 }
 
+// Documents can be finished concurrently as long as each thread uses its own
+// parser (see enable_special_characters); this also resets the LaTeX closer
+// caches of the calling thread for the new document.
+cmark_node* parser_finish(cmark_parser *parser) {
+    reset_closers();
+    return cmark_parser_finish(parser);
+}
+
+// parser for short-lived documents: memory is released with cmark_arena_reset
 cmark_parser* get_parser() {
-    cmark_parser *parser = cmark_parser_new_with_mem(options, cmark_get_arena_mem_allocator());
-    attach_extension(parser, "autolink");
-    attach_extension(parser, "table");
-    attach_extension(parser, "strikethrough");
-    attach_extension(parser, "tagfilter");
-    attach_extension(parser, "tasklist");
-    cmark_parser_attach_syntax_extension(parser, create_latex_block_extension());
-    cmark_parser_attach_syntax_extension(parser, create_latex_inline_extension());
-    return parser;
+    return get_parser_with_mem(cmark_get_arena_mem_allocator());
 }
 
 cmark_node* file_to_document(FILE *fp) {
@@ -269,7 +378,7 @@ cmark_node* file_to_document(FILE *fp) {
             break;
         }
     }
-    cmark_node *document = cmark_parser_finish(parser);
+    cmark_node *document = parser_finish(parser);
     return document;
 }
 
@@ -288,35 +397,274 @@ cmark_node* stdin_to_document(void) {
     return file_to_document(stdin);
 }
 
-cmark_node* string_to_document(const char *md) {
-    cmark_parser *parser = get_parser();
-    cmark_parser_feed(parser, md, strlen(md));
-    cmark_node *document = cmark_parser_finish(parser);
+// document owns its memory and is released with cmark_node_free
+cmark_node* buffer_to_document(const char *md, size_t len) {
+    cmark_parser *parser = get_parser_with_mem(cmark_get_default_mem_allocator());
+    cmark_parser_feed(parser, md, len);
+    cmark_node *document = parser_finish(parser);
     cmark_parser_free(parser);
     return document;
 }
 
-char* document_to_html(cmark_node *document) {
-    cmark_parser *parser = get_parser();
+cmark_node* string_to_document(const char *md) {
+    return buffer_to_document(md, strlen(md));
+}
+
+// renderers with the options a document was parsed with (see CmarkParser)
+char* document_to_html_with_options(cmark_node *document, int render_options) {
     cmark_mem *mem = cmark_get_default_mem_allocator();
-    char *result = cmark_render_html_with_mem(document, options, cmark_parser_get_syntax_extensions(parser), mem);
-    cmark_parser_free(parser);
-    return result; 
+    return cmark_render_html_with_mem(document, render_options, syntax_extensions, mem);
 }
 
-char* document_to_xml(cmark_node *document) {
+char* document_to_xml_with_options(cmark_node *document, int render_options) {
     cmark_mem *mem = cmark_get_default_mem_allocator();
-    return cmark_render_xml_with_mem(document, options, mem);
+    return cmark_render_xml_with_mem(document, render_options, mem);
 }
 
-char* document_to_cmark(cmark_node *document) {
+char* document_to_cmark_with_options(cmark_node *document, int render_options) {
+    cmark_mem *mem = cmark_get_default_mem_allocator();
+    return cmark_render_commonmark_with_mem(document, render_options, 80, mem);
+}
+
+char* document_to_latex_with_options(cmark_node *document, int render_options) {
     cmark_mem *mem = cmark_get_default_mem_allocator();
-    return cmark_render_commonmark_with_mem(document, options, 80, mem);
+    return cmark_render_latex_with_mem(document, render_options, 80, mem);
+}
+
+char* document_to_html(cmark_node *document) {
+    return document_to_html_with_options(document, options);
+}
+
+char* document_to_xml(cmark_node *document) {
+    return document_to_xml_with_options(document, options);
+}
+
+char* document_to_cmark(cmark_node *document) {
+    return document_to_cmark_with_options(document, options);
 }
 
 char* document_to_latex(cmark_node *document) {
+    return document_to_latex_with_options(document, options);
+}
+
+
+/*
+ * Flattened AST export
+ *
+ * Buffer layout (native-endian int32 values unless noted):
+ *   header     : version, number of types, number of records, string pool size
+ *   type table : (offset, length) into the string pool for each type name
+ *   records    : one ast_record per node in preorder, starting with the document
+ *   pool       : string data (bytes, not null-terminated)
+ */
+
+#define AST_VERSION 1
+#define AST_MAX_TYPES 64
+
+typedef struct {
+    int32_t type;          // index into type table
+    int32_t depth;         // nesting depth (document is 0)
+    int32_t start_line;
+    int32_t start_column;
+    int32_t end_line;
+    int32_t end_column;
+    int32_t attr[4];       // heading: level / list: type, tight, start, delim / table cell: alignment
+    int32_t str[4];        // (offset, length) pairs: literal or url, then fence info or title
+} ast_record;
+
+static void ast_string(cmark_strbuf *pool, int32_t *dest, const char *text) {
+    dest[0] = pool->size;
+    dest[1] = text == NULL ? 0 : (int32_t)strlen(text);
+    cmark_strbuf_put(pool, (const unsigned char*)text, dest[1]);
+}
+
+static int32_t ast_type(const char **types, int32_t *n_types, const char *type_string) {
+    for (int32_t i = 0; i < *n_types; i++) {
+        if (strcmp(types[i], type_string) == 0) {
+            return i;
+        }
+    }
+    if (*n_types == AST_MAX_TYPES) {
+        return -1;
+    }
+    types[*n_types] = type_string;
+    return (*n_types)++;
+}
+
+static void ast_fill_record(ast_record *rec, cmark_strbuf *pool, cmark_node *node, const char *type_string, int32_t *column) {
+    rec->start_line = cmark_node_get_start_line(node);
+    rec->start_column = cmark_node_get_start_column(node);
+    rec->end_line = cmark_node_get_end_line(node);
+    rec->end_column = cmark_node_get_end_column(node);
+
+    switch (cmark_node_get_type(node)) {
+        case CMARK_NODE_HEADING:
+            rec->attr[0] = cmark_node_get_heading_level(node);
+            break;
+        case CMARK_NODE_LIST:
+            rec->attr[0] = cmark_node_get_list_type(node);
+            rec->attr[1] = cmark_node_get_list_tight(node);
+            rec->attr[2] = cmark_node_get_list_start(node);
+            rec->attr[3] = cmark_node_get_list_delim(node);
+            break;
+        case CMARK_NODE_CODE_BLOCK:
+            ast_string(pool, rec->str + 2, cmark_node_get_fence_info(node));
+            ast_string(pool, rec->str, cmark_node_get_literal(node));
+            break;
+        case CMARK_NODE_TEXT:
+        case CMARK_NODE_CODE:  // includes latex nodes
+        case CMARK_NODE_HTML_BLOCK:
+        case CMARK_NODE_HTML_INLINE:
+            ast_string(pool, rec->str, cmark_node_get_literal(node));
+            break;
+        case CMARK_NODE_LINK:
+        case CMARK_NODE_IMAGE:
+            ast_string(pool, rec->str, cmark_node_get_url(node));
+            ast_string(pool, rec->str + 2, cmark_node_get_title(node));
+            break;
+        default:
+            // table node types are registered at runtime by the extension
+            if (strcmp(type_string, "table_row") == 0 || strcmp(type_string, "table_header") == 0) {
+                *column = 0;
+            } else if (strcmp(type_string, "table_cell") == 0) {
+                cmark_node *table = cmark_node_parent(cmark_node_parent(node));
+                if (*column < cmark_gfm_extensions_get_table_columns(table)) {
+                    rec->attr[0] = cmark_gfm_extensions_get_table_alignments(table)[*column];
+                }
+                (*column)++;
+            }
+            break;
+    }
+}
+
+char* document_to_ast(cmark_node *document, size_t *length) {
+    cmark_mem *mem = cmark_get_default_mem_allocator();
+    const char *types[AST_MAX_TYPES];
+    int32_t type_table[2 * AST_MAX_TYPES];
+    int32_t n_types = 0, n_records = 0, depth = 0, column = 0;
+    cmark_strbuf records, pool, out;
+    cmark_strbuf_init(mem, &records, 0);
+    cmark_strbuf_init(mem, &pool, 0);
+
+    // preorder walk of the tree without recursion
+    cmark_node *node = document;
+    while (node != NULL) {
+        ast_record rec;
+        memset(&rec, 0, sizeof(rec));
+        const char *type_string = cmark_node_get_type_string(node);
+        rec.type = ast_type(types, &n_types, type_string);
+        if (rec.type < 0) {
+            cmark_strbuf_free(&records);
+            cmark_strbuf_free(&pool);
+            return NULL;
+        }
+        rec.depth = depth;
+        ast_fill_record(&rec, &pool, node, type_string, &column);
+        cmark_strbuf_put(&records, (const unsigned char*)&rec, sizeof(rec));
+        n_records++;
+
+        // advance to first child, next sibling, or next sibling of an ancestor
+        if (cmark_node_first_child(node) != NULL) {
+            node = cmark_node_first_child(node);
+            depth++;
+            continue;
+        }
+        while (node != document && cmark_node_next(node) == NULL) {
+            node = cmark_node_parent(node);
+            depth--;
+        }
+        node = node == document ? NULL : cmark_node_next(node);
+    }
+
+    // type names go at the end of the string pool
+    for (int32_t i = 0; i < n_types; i++) {
+        ast_string(&pool, type_table + 2 * i, types[i]);
+    }
+
+    // assemble output buffer
+    int32_t header[4] = {AST_VERSION, n_types, n_records, pool.size};
+    cmark_strbuf_init(mem, &out, sizeof(header) + 2 * sizeof(int32_t) * n_types + records.size + pool.size);
+    cmark_strbuf_put(&out, (const unsigned char*)header, sizeof(header));
+    cmark_strbuf_put(&out, (const unsigned char*)type_table, 2 * sizeof(int32_t) * n_types);
+    cmark_strbuf_put(&out, records.ptr, records.size);
+    cmark_strbuf_put(&out, pool.ptr, pool.size);
+    cmark_strbuf_free(&records);
+    cmark_strbuf_free(&pool);
+    *length = out.size;
+    return (char*)cmark_strbuf_detach(&out);
+}
+
+/*
+ * Heading outline export
+ *
+ * Buffer layout (native-endian int32 values unless noted):
+ *   header  : version, number of headings, string pool size
+ *   records : level, start line and (offset, length) of the text in the pool
+ *             for each top-level heading in document order
+ *   pool    : heading text (bytes, not null-terminated)
+ *
+ * Heading text is the concatenated literals of the heading's inlines, with
+ * soft breaks as spaces and hard breaks as newlines.
+ */
+
+#define OUTLINE_VERSION 1
+
+static void outline_text(cmark_strbuf *pool, cmark_node *heading) {
+    cmark_iter *iter = cmark_iter_new(heading);
+    cmark_event_type ev;
+    while ((ev = cmark_iter_next(iter)) != CMARK_EVENT_DONE) {
+        cmark_node *node = cmark_iter_get_node(iter);
+        if (ev != CMARK_EVENT_ENTER) {
+            continue;
+        }
+        switch (cmark_node_get_type(node)) {
+            case CMARK_NODE_TEXT:
+            case CMARK_NODE_CODE:  // includes latex nodes
+            case CMARK_NODE_HTML_INLINE:
+                cmark_strbuf_puts(pool, cmark_node_get_literal(node));
+                break;
+            case CMARK_NODE_SOFTBREAK:
+                cmark_strbuf_putc(pool, ' ');
+                break;
+            case CMARK_NODE_LINEBREAK:
+                cmark_strbuf_putc(pool, '\n');
+                break;
+            default:
+                break;
+        }
+    }
+    cmark_iter_free(iter);
+}
+
+char* document_to_outline(cmark_node *document, size_t *length) {
     cmark_mem *mem = cmark_get_default_mem_allocator();
-    return cmark_render_latex_with_mem(document, options, 80, mem);
+    int32_t n_headings = 0;
+    cmark_strbuf records, pool, out;
+    cmark_strbuf_init(mem, &records, 0);
+    cmark_strbuf_init(mem, &pool, 0);
+
+    // only top-level blocks are visited, so body inlines are never walked
+    for (cmark_node *node = cmark_node_first_child(document); node != NULL; node = cmark_node_next(node)) {
+        if (cmark_node_get_type(node) != CMARK_NODE_HEADING) {
+            continue;
+        }
+        int32_t rec[4] = {cmark_node_get_heading_level(node), cmark_node_get_start_line(node), pool.size, 0};
+        outline_text(&pool, node);
+        rec[3] = pool.size - rec[2];
+        cmark_strbuf_put(&records, (const unsigned char*)rec, sizeof(rec));
+        n_headings++;
+    }
+
+    // assemble output buffer
+    int32_t header[3] = {OUTLINE_VERSION, n_headings, pool.size};
+    cmark_strbuf_init(mem, &out, sizeof(header) + records.size + pool.size);
+    cmark_strbuf_put(&out, (const unsigned char*)header, sizeof(header));
+    cmark_strbuf_put(&out, records.ptr, records.size);
+    cmark_strbuf_put(&out, pool.ptr, pool.size);
+    cmark_strbuf_free(&records);
+    cmark_strbuf_free(&pool);
+    *length = out.size;
+    return (char*)cmark_strbuf_detach(&out);
 }
 
 void print_and_free(const char *fmt, char *result) {
@@ -0,0 +1,154 @@
+"""
+Lazily bound ctypes interface to the gfm shared library
+
+The generated cmarkgfm module declares every structure and function found in
+the library, which makes importing it expensive.  This module only declares
+opaque handle types plus a signature table, and looks up and types each
+function the first time it is accessed as a module attribute.
+
+Pointers are not interchangeable between this module and the generated module
+because each declares its own structure types.
+
+If bin/Makefile has built the optional compiled accessor module it is exposed
+as accessors, otherwise accessors is None.
+"""
+
+import ctypes
+import importlib.machinery
+import importlib.util
+import sys
+import os
+
+# gfm symbols are made global so that the compiled accessor module can link against them
+platform_ext = {"darwin":".dylib", "win32":".dll"}.get(sys.platform, ".so")
+gfm = ctypes.CDLL(os.path.join(os.path.dirname(__file__), "bin/gfm" + platform_ext), mode=ctypes.RTLD_GLOBAL)
+
+def _loadAccessors():
+    """Import the compiled accessor module built by bin/Makefile, or None if it isn't built"""
+    for suffix in importlib.machinery.EXTENSION_SUFFIXES:
+        path = os.path.join(os.path.dirname(__file__), "bin/accessors" + suffix)
+        if os.path.exists(path):
+            spec = importlib.util.spec_from_file_location(__package__ + ".accessors", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            return module
+    return None
+
+accessors = _loadAccessors()
+
+##### OPAQUE TYPES #####
+
+class cmark_node(ctypes.Structure):
+    pass
+class cmark_parser(ctypes.Structure):
+    pass
+class cmark_iter(ctypes.Structure):
+    pass
+class cmark_mem(ctypes.Structure):
+    _fields_ = [
+        ("calloc", ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_uint64, ctypes.c_uint64)),
+        ("realloc", ctypes.CFUNCTYPE(ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint64)),
+        ("free", ctypes.CFUNCTYPE(None, ctypes.c_void_p))
+    ]
+
+NODE = ctypes.POINTER(cmark_node)
+PARSER = ctypes.POINTER(cmark_parser)
+ITER = ctypes.POINTER(cmark_iter)
+MEM = ctypes.POINTER(cmark_mem)
+CHARS = ctypes.POINTER(ctypes.c_char)  # raw pointer, e.g. for strings that the caller must free
+
+##### OPTIONS (cmark-gfm.h) #####
+
+OPT_DEFAULT = 0
+OPT_SOURCEPOS = 1 << 1
+OPT_HARDBREAKS = 1 << 2
+OPT_NOBREAKS = 1 << 4
+OPT_VALIDATE_UTF8 = 1 << 9
+OPT_SMART = 1 << 10
+OPT_GITHUB_PRE_LANG = 1 << 11
+OPT_LIBERAL_HTML_TAG = 1 << 12
+OPT_FOOTNOTES = 1 << 13
+OPT_STRIKETHROUGH_DOUBLE_TILDE = 1 << 14
+OPT_TABLE_PREFER_STYLE_ATTRIBUTES = 1 << 15
+OPT_FULL_INFO_STRING = 1 << 16
+OPT_UNSAFE = 1 << 17
+
+##### FUNCTION SIGNATURES #####
+
+# name: (restype, argtypes)
+SIGNATURES = {
+
+    # application (bin/main.c)
+    "startup":                  (None,   ()),
+    "shutdown":                 (None,   ()),
+    "get_parser_with_mem":      (PARSER, (MEM,)),
+    "get_parser_with_options":  (PARSER, (ctypes.c_int32, MEM)),
+    "parser_finish":            (NODE,   (PARSER,)),
+    "string_to_document":       (NODE,   (ctypes.c_char_p,)),
+    "buffer_to_document":       (NODE,   (ctypes.c_char_p, ctypes.c_uint64)),
+    "document_to_ast":          (CHARS,  (NODE, ctypes.POINTER(ctypes.c_uint64))),
+    "document_to_cmark":        (CHARS,  (NODE,)),
+    "document_to_cmark_with_options": (CHARS,  (NODE, ctypes.c_int32)),
+    "document_to_html":         (CHARS,  (NODE,)),
+    "document_to_html_with_options": (CHARS,  (NODE, ctypes.c_int32)),
+    "document_to_latex":        (CHARS,  (NODE,)),
+    "document_to_latex_with_options": (CHARS,  (NODE, ctypes.c_int32)),
+    "document_to_outline":      (CHARS,  (NODE, ctypes.POINTER(ctypes.c_uint64))),
+    "document_to_xml":          (CHARS,  (NODE,)),
+    "document_to_xml_with_options": (CHARS,  (NODE, ctypes.c_int32)),
+
+    # memory
+    "cmark_get_default_mem_allocator": (MEM, ()),
+
+    # parser
+    "cmark_parser_feed":        (None,   (PARSER, ctypes.c_char_p, ctypes.c_uint64)),
+    "cmark_parser_finish":      (NODE,   (PARSER,)),
+    "cmark_parser_free":        (None,   (PARSER,)),
+
+    # tree traversal
+    "cmark_node_free":          (None,   (NODE,)),
+    "cmark_node_first_child":   (NODE,   (NODE,)),
+    "cmark_node_last_child":    (NODE,   (NODE,)),
+    "cmark_node_next":          (NODE,   (NODE,)),
+    "cmark_node_previous":      (NODE,   (NODE,)),
+    "cmark_node_parent":        (NODE,   (NODE,)),
+    "cmark_iter_new":           (ITER,   (NODE,)),
+    "cmark_iter_next":          (ctypes.c_uint32, (ITER,)),
+    "cmark_iter_get_node":      (NODE,   (ITER,)),
+    "cmark_iter_get_event_type": (ctypes.c_uint32, (ITER,)),
+    "cmark_iter_reset":         (None,   (ITER, NODE, ctypes.c_uint32)),
+    "cmark_iter_free":          (None,   (ITER,)),
+
+    # node attributes
+    "cmark_node_get_type":          (ctypes.c_uint32, (NODE,)),
+    "cmark_node_get_type_string":   (ctypes.c_char_p, (NODE,)),
+    "cmark_node_get_start_line":    (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_start_column":  (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_end_line":      (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_end_column":    (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_literal":       (ctypes.c_char_p, (NODE,)),
+    "cmark_node_get_heading_level": (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_fence_info":    (ctypes.c_char_p, (NODE,)),
+    "cmark_node_get_url":           (ctypes.c_char_p, (NODE,)),
+    "cmark_node_get_title":         (ctypes.c_char_p, (NODE,)),
+    "cmark_node_get_list_type":     (ctypes.c_uint32, (NODE,)),
+    "cmark_node_get_list_tight":    (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_list_start":    (ctypes.c_int32,  (NODE,)),
+    "cmark_node_get_list_delim":    (ctypes.c_uint32, (NODE,)),
+    "cmark_gfm_extensions_get_table_alignments": (CHARS,  (NODE,)),
+    "cmark_gfm_extensions_get_table_columns":    (ctypes.c_uint16, (NODE,)),
+}
+
+##### LAZY BINDING #####
+
+def __getattr__(name):
+    """Bind a library function on first access (later lookups hit the module dict)"""
+    if name not in SIGNATURES or not hasattr(gfm, name):
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    fn = getattr(gfm, name)
+    fn.restype, fn.argtypes = SIGNATURES[name]
+    globals()[name] = fn
+    return fn
+
+def __dir__():
+    return sorted(set(globals()) | set(SIGNATURES))
@@ -561,6 +561,14 @@ if hasattr(gfm, "attach_extension"):
         ctypes.c_char_p,  # name
     ])
 
+if hasattr(gfm, "buffer_to_document"):
+    buffer_to_document = gfm.buffer_to_document
+    buffer_to_document.restype = ctypes.POINTER(cmark_node)
+    buffer_to_document.argtypes = tuple([
+        ctypes.c_char_p,  # md
+        ctypes.c_uint64,  # len
+    ])
+
 if hasattr(gfm, "cmark_arena_pop"):
     cmark_arena_pop = gfm.cmark_arena_pop
     cmark_arena_pop.restype = ctypes.c_int32
@@ -2367,6 +2375,14 @@ if hasattr(gfm, "create_tasklist_extension"):
 
     ])
 
+if hasattr(gfm, "document_to_ast"):
+    document_to_ast = gfm.document_to_ast
+    document_to_ast.restype = ctypes.POINTER(ctypes.c_char)
+    document_to_ast.argtypes = tuple([
+        ctypes.POINTER(cmark_node),  # document
+        ctypes.POINTER(ctypes.c_uint64),  # length
+    ])
+
 if hasattr(gfm, "document_to_cmark"):
     document_to_cmark = gfm.document_to_cmark
     document_to_cmark.restype = ctypes.c_char_p
@@ -2374,6 +2390,14 @@ if hasattr(gfm, "document_to_cmark"):
         ctypes.POINTER(cmark_node),  # document
     ])
 
+if hasattr(gfm, "document_to_cmark_with_options"):
+    document_to_cmark_with_options = gfm.document_to_cmark_with_options
+    document_to_cmark_with_options.restype = ctypes.c_char_p
+    document_to_cmark_with_options.argtypes = tuple([
+        ctypes.POINTER(cmark_node),  # document
+        ctypes.c_int32,  # render_options
+    ])
+
 if hasattr(gfm, "document_to_html"):
     document_to_html = gfm.document_to_html
     document_to_html.restype = ctypes.c_char_p
@@ -2381,6 +2405,14 @@ if hasattr(gfm, "document_to_html"):
         ctypes.POINTER(cmark_node),  # document
     ])
 
+if hasattr(gfm, "document_to_html_with_options"):
+    document_to_html_with_options = gfm.document_to_html_with_options
+    document_to_html_with_options.restype = ctypes.c_char_p
+    document_to_html_with_options.argtypes = tuple([
+        ctypes.POINTER(cmark_node),  # document
+        ctypes.c_int32,  # render_options
+    ])
+
 if hasattr(gfm, "document_to_latex"):
     document_to_latex = gfm.document_to_latex
     document_to_latex.restype = ctypes.c_char_p
@@ -2388,6 +2420,22 @@ if hasattr(gfm, "document_to_latex"):
         ctypes.POINTER(cmark_node),  # document
     ])
 
+if hasattr(gfm, "document_to_latex_with_options"):
+    document_to_latex_with_options = gfm.document_to_latex_with_options
+    document_to_latex_with_options.restype = ctypes.c_char_p
+    document_to_latex_with_options.argtypes = tuple([
+        ctypes.POINTER(cmark_node),  # document
+        ctypes.c_int32,  # render_options
+    ])
+
+if hasattr(gfm, "document_to_outline"):
+    document_to_outline = gfm.document_to_outline
+    document_to_outline.restype = ctypes.POINTER(ctypes.c_char)
+    document_to_outline.argtypes = tuple([
+        ctypes.POINTER(cmark_node),  # document
+        ctypes.POINTER(ctypes.c_uint64),  # length
+    ])
+
 if hasattr(gfm, "document_to_xml"):
     document_to_xml = gfm.document_to_xml
     document_to_xml.restype = ctypes.c_char_p
@@ -2395,6 +2443,14 @@ if hasattr(gfm, "document_to_xml"):
         ctypes.POINTER(cmark_node),  # document
     ])
 
+if hasattr(gfm, "document_to_xml_with_options"):
+    document_to_xml_with_options = gfm.document_to_xml_with_options
+    document_to_xml_with_options.restype = ctypes.c_char_p
+    document_to_xml_with_options.argtypes = tuple([
+        ctypes.POINTER(cmark_node),  # document
+        ctypes.c_int32,  # render_options
+    ])
+
 if hasattr(gfm, "file_to_document"):
     file_to_document = gfm.file_to_document
     file_to_document.restype = ctypes.POINTER(cmark_node)
@@ -2416,6 +2472,21 @@ if hasattr(gfm, "get_parser"):
 
     ])
 
+if hasattr(gfm, "get_parser_with_mem"):
+    get_parser_with_mem = gfm.get_parser_with_mem
+    get_parser_with_mem.restype = ctypes.POINTER(cmark_parser)
+    get_parser_with_mem.argtypes = tuple([
+        ctypes.POINTER(cmark_mem),  # mem
+    ])
+
+if hasattr(gfm, "get_parser_with_options"):
+    get_parser_with_options = gfm.get_parser_with_options
+    get_parser_with_options.restype = ctypes.POINTER(cmark_parser)
+    get_parser_with_options.argtypes = tuple([
+        ctypes.c_int32,  # parser_options
+        ctypes.POINTER(cmark_mem),  # mem
+    ])
+
 if hasattr(gfm, "houdini_escape_href"):
     houdini_escape_href = gfm.houdini_escape_href
     houdini_escape_href.restype = ctypes.c_int32
@@ -2479,6 +2550,13 @@ if hasattr(gfm, "main"):
         ctypes.POINTER(ctypes.c_char_p),  # argv
     ])
 
+if hasattr(gfm, "parser_finish"):
+    parser_finish = gfm.parser_finish
+    parser_finish.restype = ctypes.POINTER(cmark_node)
+    parser_finish.argtypes = tuple([
+        ctypes.POINTER(cmark_parser),  # parser
+    ])
+
 if hasattr(gfm, "print_and_free"):
     print_and_free = gfm.print_and_free
     print_and_free.restype = None
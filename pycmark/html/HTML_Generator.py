@@ -15,8 +15,8 @@ def toStyledHTML(txt, withIndex=False):
     # generate a LatexDocument with [toc] entries converted to something that won't get wrapped
     doc = cmark.parse(txt.replace('[TOC]', '<toc/>').replace('[toc]', '<toc/>'))
 
-    # hierarchical document tree
-    dt = DocumentTree.fromAst(doc.toAST())
+    # hierarchical document tree (only headings are decoded from the native tree)
+    dt = DocumentTree.fromAst(doc.toAST(lazy=True))
 
     # generate html and wrap in a dom object
     dom = xml.dom.minidom.parseString('<body>' + doc.toHTML() + '</body>')
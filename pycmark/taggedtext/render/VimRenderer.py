@@ -1,7 +1,7 @@
 import sys
 from pycmark.taggedtext.render.Renderer import Renderer
 from pycmark.util.TerminalColors256 import Color256
-from pycmark.ast.DocumentTree import DocumentTree
+from pycmark.ast.DocumentTree import DocumentTree, OutlineTree
 from pycmark.util.TypedTree import TypedTree
 from pycmark.taggedtext.TaggedCmarkDocument import TaggedTextDocument
 
@@ -56,7 +56,11 @@ class VimRenderer(Renderer):
 
     @staticmethod
     def getTOC(doc, offset=0, withUnicode=True, tabstop=3):
-        """Extract a table of contents tree view from a document AST"""
+        """Extract a table of contents tree view from a document AST or outline
+
+        doc is either a document AST or a (level, text, line) heading list from
+        pycmark.cmarkgfm.outline, which avoids building an AST.
+        """
 
         if withUnicode:
             TEE = u'\u251c' + u'\u2500' * (tabstop - 1)
@@ -69,7 +73,7 @@ class VimRenderer(Renderer):
         SPACE = ' ' * tabstop
 
         # source data
-        tree = DocumentTree.fromAst(doc)
+        tree = OutlineTree.fromOutline(doc) if isinstance(doc, list) else DocumentTree.fromAst(doc)
 
         # container for tree representation
         tree_repr = []
@@ -0,0 +1,201 @@
+from collections import namedtuple
+import difflib
+
+from pycmark.util.TypedTree import TypedTree
+
+################################################################################
+
+class Edit(namedtuple('Edit', ['op', 'src', 'dst', 'old', 'new'])):
+    """One step of an edit script between two TypedTrees
+
+    Paths are tuples of field names and sequence indices from the root, e.g.
+    ('nodes', 3, 'children', 0).  src paths are in the old tree and dst paths
+    in the new one:
+        - insert : new subtree at dst
+        - delete : old subtree at src
+        - update : the value at src (a primitive, or a subtree of a different
+                   shape) is replaced by new at dst
+        - move   : an unchanged subtree at src is found at dst
+    """
+    __slots__ = ()
+
+    def __repr__(self):
+        path = lambda p: '/'.join([str(k) for k in p])
+        if self.op == 'insert':
+            return 'insert({})'.format(path(self.dst))
+        elif self.op == 'delete':
+            return 'delete({})'.format(path(self.src))
+        return '{}({} -> {})'.format(self.op, path(self.src), path(self.dst))
+
+################################################################################
+
+def _isContainer(x):
+    """True for nodes (including views such as CmarkNodeView, which aren't tuples) and tuples"""
+    return isinstance(x, (TypedTree.TT, tuple))
+
+class SubtreeNumbers(object):
+    """Value numbering of subtrees: structurally equal subtrees get the same number
+
+    A subtree's number is assigned from its tag, fields and the numbers of its
+    members, so it is computed once per subtree and comparing two numbers is
+    a perfect (collision free) structural comparison.  Fields named in ignore
+    (e.g. 'position') are left out.  Numbers are cached by object identity,
+    so the numbered trees have to stay alive while the table is used.
+    """
+
+    def __init__(self, ignore=()):
+        self.ignore = frozenset(ignore)
+        self._keys = {}  # (shape, member tokens) -> number
+        self._numbers = {}  # id of a node or tuple -> number
+        self._alive = []  # numbered containers, so their ids stay unique
+
+    def __call__(self, x):
+        """Number of a node or tuple, or a token that compares primitives exactly"""
+        if not _isContainer(x):
+            return (type(x), x)
+        numbers = self._numbers
+        if id(x) in numbers:
+            return numbers[id(x)]
+
+        # postorder walk without recursion: containers are numbered after their members
+        stack = [(x, False)]
+        while len(stack) > 0:
+            v, expanded = stack.pop()
+            if id(v) in numbers:
+                continue
+            members = self._members(v)
+            if not expanded:
+                stack.append((v, True))
+                stack += [(m, False) for m in members if _isContainer(m)]
+            else:
+                tokens = tuple([numbers[id(m)] if _isContainer(m) else (type(m), m) for m in members])
+                shape = (v._tag, tuple(v._fields)) if isinstance(v, TypedTree.TT) else None
+                numbers[id(v)] = self._keys.setdefault((shape, tokens), len(self._keys))
+                self._alive.append(v)
+        return numbers[id(x)]
+
+    def same(self, x, y):
+        """True if x and y are equal primitives or containers already numbered the same"""
+        if _isContainer(x) or _isContainer(y):
+            return id(x) in self._numbers and self._numbers.get(id(y)) == self._numbers[id(x)]
+        return (type(x), x) == (type(y), y)
+
+    def _members(self, x):
+        """Compared members of a node or tuple"""
+        if isinstance(x, TypedTree.TT):
+            return [v for k, v in zip(x._fields, x) if k not in self.ignore]
+        return list(x)
+
+################################################################################
+
+def diff(a, b, ignore=()):
+    """Edit script (a list of Edits) that turns TypedTree a into b
+
+    Shared subtrees (e.g. from an Interner or the untouched parts of an
+    updated tree) are skipped by identity.  Nodes of the same tag and fields
+    are compared field by field.  Sequence members are aligned on a longest
+    common subsequence of their value numbers (SubtreeNumbers), and the
+    members left between matches are paired up by tag, so an edited block is
+    reported as changes inside it rather than as a delete and an insert.
+    Identical subtrees deleted in one place and inserted in another are
+    reported as moves.  Differences in the fields named in ignore (e.g.
+    'position', which shifts after every edit) are not reported.
+    """
+    number = SubtreeNumbers(ignore)
+    edits = []
+    stack = [(a, b, (), ())]
+    while len(stack) > 0:
+        x, y, src, dst = stack.pop()
+        if x is y or number.same(x, y):
+            continue
+        if isinstance(x, TypedTree.TT) and isinstance(y, TypedTree.TT) \
+                and x._tag == y._tag and x._fields == y._fields:
+            for k, u, v in reversed(list(zip(x._fields, x, y))):
+                if k not in number.ignore:
+                    stack.append((u, v, src + (k,), dst + (k,)))
+        elif isinstance(x, tuple) and isinstance(y, tuple) \
+                and not isinstance(x, TypedTree.TT) and not isinstance(y, TypedTree.TT):
+            pairs = []
+            for i, j in _align(x, y, number):
+                if i is None:
+                    edits.append(Edit('insert', None, dst + (j,), None, y[j]))
+                elif j is None:
+                    edits.append(Edit('delete', src + (i,), None, x[i], None))
+                else:
+                    pairs.append((x[i], y[j], src + (i,), dst + (j,)))
+            stack += reversed(pairs)
+        else:
+            edits.append(Edit('update', src, dst, x, y))
+    return _findMoves(edits, number)
+
+# largest table for an exact longest common subsequence (difflib is used above it)
+LCS_LIMIT = 1 << 20
+
+def _lcs(kx, ky):
+    """Index pairs of a longest common subsequence of the sequences kx and ky"""
+    n, m = len(kx), len(ky)
+    if n == 0 or m == 0:
+        return []
+    if n * m > LCS_LIMIT:
+        blocks = difflib.SequenceMatcher(None, kx, ky, autojunk=False).get_matching_blocks()
+        return [(block.a + d, block.b + d) for block in blocks for d in range(block.size)]
+    L = [[0] * (m + 1) for _ in range(n + 1)]  # L[i][j]: length of an LCS of kx[i:] and ky[j:]
+    for i in range(n - 1, -1, -1):
+        row, below, xi = L[i], L[i+1], kx[i]
+        for j in range(m - 1, -1, -1):
+            row[j] = below[j+1] + 1 if xi == ky[j] else max(below[j], row[j+1])
+    pairs, i, j = [], 0, 0
+    while i < n and j < m:
+        if kx[i] == ky[j]:
+            pairs.append((i, j))
+            i, j = i + 1, j + 1
+        elif L[i+1][j] >= L[i][j+1]:
+            i += 1
+        else:
+            j += 1
+    return pairs
+
+def _gaps(n, m, pairs):
+    """Generate (i, j) for matched pairs and (i, None) / (None, j) for the unmatched indices in order"""
+    i = j = 0
+    for p, q in list(pairs) + [(n, m)]:
+        for i in range(i, p):
+            yield i, None
+        for j in range(j, q):
+            yield None, j
+        if p < n:
+            yield p, q
+        i, j = p + 1, q + 1
+
+def _align(x, y, number):
+    """Generate (i, j) for aligned members of tuples x and y, with None for an unmatched side"""
+    n, m = len(x), len(y)
+    lo = hi = 0  # shared prefix and suffix
+    while lo < min(n, m) and x[lo] is y[lo]:
+        lo += 1
+    while hi < min(n, m) - lo and x[n-1-hi] is y[m-1-hi]:
+        hi += 1
+    x, y = x[lo:n-hi], y[lo:m-hi]
+    tag = lambda v: (getattr(v, '_tag', None),) if _isContainer(v) else type(v)
+    kx, ky = [number(v) for v in x], [number(v) for v in y]
+    i0 = j0 = 0
+    for i, j in _lcs(kx, ky) + [(len(x), len(y))]:
+        # pair up the members between two matches by tag
+        tags = _lcs([tag(v) for v in x[i0:i]], [tag(v) for v in y[j0:j]])
+        for p, q in _gaps(i - i0, j - j0, tags):
+            yield (None if p is None else lo + i0 + p), (None if q is None else lo + j0 + q)
+        i0, j0 = i + 1, j + 1
+
+def _findMoves(edits, number):
+    """Replace a delete and an insert of identical subtrees by a move"""
+    deleted = {}  # number -> indices of delete edits
+    for i, e in enumerate(edits):
+        if e.op == 'delete' and _isContainer(e.old):
+            deleted.setdefault(number(e.old), []).append(i)
+    out = list(edits)
+    for i, e in enumerate(edits):
+        if e.op == 'insert' and _isContainer(e.new) and len(deleted.get(number(e.new), [])) > 0:
+            d = deleted[number(e.new)].pop(0)
+            out[d] = Edit('move', edits[d].src, e.dst, edits[d].old, e.new)
+            out[i] = None
+    return [e for e in out if e is not None]
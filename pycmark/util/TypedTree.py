@@ -3,6 +3,9 @@ import sys
 import json
 import base64
 import keyword
+import mmap
+import struct
+import codecs
 
 # running python 3?
 PY3 = sys.version_info[0] == 3
@@ -10,12 +13,213 @@ PY3 = sys.version_info[0] == 3
 # allowed primitives
 if not PY3:
     PRIMITIVES = {str, unicode, int, long, float, bool}
+    intern_string = intern
 else:
     PRIMITIVES = {bytes, str, int, float, bool}
+    intern_string = sys.intern
 
 # prefix for JSON serialization
 JSON_PREFIX = '{"TypedTree": '
 
+# compact JSON schema: a table of (tag, keys) shapes, nodes as [shape index,
+# values...] arrays, tuples as [-1, members...] and bytes as {"b": base64}.
+# Version 1 (a t/k/v/b object per node) has no version field.
+JSON_VERSION = 2
+
+# size of reads and batched writes for streaming JSON
+JSON_CHUNK_SIZE = 1 << 16
+
+# binary serialization: magic and version, string table, schema table and an
+# op stream that rebuilds the tree on a stack.  Values are written in
+# postorder, so a node op pops its fields and a tuple op pops its elements.
+BINARY_MAGIC = b'TypedTree\x00'
+BINARY_VERSION = 1
+OP_NONE, OP_FALSE, OP_TRUE, OP_INT, OP_FLOAT, OP_STR, OP_BYTES, OP_TUPLE, OP_NODE = range(9)
+OP_SMALL_INT = 0x20  # ops from here on are ints with zigzag value op - OP_SMALL_INT
+
+def _writeJSON(f, chunks):
+    """Write JSON_PREFIX, the chunks of a serialized node and the closing brace to f in batches"""
+    batch, size = [JSON_PREFIX], len(JSON_PREFIX)
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk)
+        if size >= JSON_CHUNK_SIZE:
+            f.write(''.join(batch))
+            batch, size = [], 0
+    batch.append('}')
+    f.write(''.join(batch))
+
+class _JSONReader(object):
+    """Incremental reader for the root node of a JSON serialized TypedTree
+
+    Only the structure of the root node is scanned here; its fields and the
+    members of its sequences are each decoded with json as soon as they have
+    been read, and the buffer is trimmed as it is consumed.
+    """
+
+    def __init__(self, f, T):
+        if hasattr(f, 'read'):
+            self.chunks = iter(lambda: f.read(JSON_CHUNK_SIZE), f.read(0))
+        else:
+            self.chunks = iter(f)
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder(object_hook=T._jsonobject)
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self, n=1):
+        """Read until at least n unconsumed characters are buffered (False at end of input)"""
+        if self.pos > 0:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        while len(self.buf) < n and not self.eof:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                self.eof = True
+                chunk = self.decoder.decode(b'', final=True)
+            elif isinstance(chunk, bytes):
+                chunk = self.decoder.decode(chunk)
+            self.buf += chunk
+        return len(self.buf) >= n
+
+    def peek(self):
+        """Next non-whitespace character without consuming it ('' at end of input)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self.more():
+                return self.buf[self.pos:self.pos+1]
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise ValueError("Not a serialized TypedTree!")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next json value, reading more input until it is complete"""
+        self.peek()
+        while True:
+            try:
+                x, end = self.json.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:  # a number could continue in the next chunk
+                    self.pos = end
+                    return x
+            except ValueError:
+                if self.eof:
+                    raise
+            self.more(2 * (len(self.buf) - self.pos) + 1)  # doubling keeps retries linear
+
+    def root(self):
+        """Generate events for the root node
+
+        ('field', key, value) for the t, k and b entries, ('start', i) before the
+        members of a sequence field i, ('item', i, node) for each member and
+        ('value', i, value) for other fields.
+
+        Version 2 data gives ('field', key, value) for the version and shapes
+        entries and ('field', 'shape', index) for the root node, and its
+        members and values are left in their array form.  If the root comes
+        before the header (e.g. from json.dump with sort_keys) it can't be
+        decoded yet, so it is read whole and given as ('field', 'root', array).
+        """
+        if not self.more(len(JSON_PREFIX)) or self.buf[:len(JSON_PREFIX)] != JSON_PREFIX:
+            raise ValueError("Not a serialized TypedTree!")
+        self.pos = len(JSON_PREFIX)
+        self.expect('{')
+        seen = set()  # keys read so far
+        while self.peek() != '}':
+            key = self.value()
+            self.expect(':')
+            seen.add(key)
+            if key == 'root' and 'version' in seen and 'shapes' in seen:
+                for event in self.arrayRoot():
+                    yield event
+            elif key != 'v':
+                yield 'field', key, self.value()
+            else:
+                self.expect('[')
+                i = 0
+                while self.peek() != ']':
+                    if self.peek() == '[':
+                        self.pos += 1
+                        yield 'start', i
+                        while self.peek() != ']':
+                            yield 'item', i, self.value()
+                            if self.peek() == ',':
+                                self.pos += 1
+                        self.pos += 1
+                    else:
+                        yield 'value', i, self.value()
+                    if self.peek() == ',':
+                        self.pos += 1
+                    i += 1
+                self.pos += 1
+            if self.peek() == ',':
+                self.pos += 1
+        self.expect('}')
+        self.expect('}')
+        if self.peek() != '':
+            raise ValueError("Not a serialized TypedTree!")
+
+    def arrayRoot(self):
+        """Generate the events for a version 2 root node array"""
+        self.expect('[')
+        yield 'field', 'shape', self.value()
+        i = 0
+        while self.peek() != ']':
+            if self.peek() == ',':
+                self.pos += 1
+            elif self.peek() == '[':
+                self.pos += 1
+                first = self.value()
+                if first == -1:  # tuple: stream its members
+                    yield 'start', i
+                    while self.peek() != ']':
+                        if self.peek() == ',':
+                            self.pos += 1
+                        else:
+                            yield 'item', i, self.value()
+                else:  # node: read the rest of its array
+                    x = [first]
+                    while self.peek() != ']':
+                        if self.peek() == ',':
+                            self.pos += 1
+                        else:
+                            x.append(self.value())
+                    yield 'value', i, x
+                self.pos += 1
+                i += 1
+            else:
+                yield 'value', i, self.value()
+                i += 1
+        self.pos += 1
+
+def _putVarint(buf, n):
+    """Append an unsigned LEB128 varint to a bytearray"""
+    while n >= 0x80:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _getVarint(view, pos):
+    """Read an unsigned LEB128 varint and return (value, position after it)"""
+    n = shift = 0
+    while True:
+        b = view[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def _subclassConstructor(cls):
+    """Constructor for a module-level subclass from member values in field order"""
+    return lambda *values: tuple.__new__(cls, values)
+
+def _unpickleBinary(data, classes=()):
+    """Rebuild a subtree pickled by TypedTree.TT.__reduce__ in the binary format"""
+    return TypedTree._frombinary(data, classes)
+
 class TypedTree(object):
     """
     TypedTree is an extension of collections.namedtuple that enforces immutability
@@ -23,19 +227,187 @@ class TypedTree(object):
     Members must be one of:
         - another TypedTree
         - a primitive (string, bytes, boolean, number)
+        - a lazy primitive (TypedTree.Lazy), which is computed each time it is accessed
         - a tuple of acceptable members
+
+    Node classes have no instance dictionary: members are stored in the tuple
+    and the tag (_tag) and its interned integer id (_tagId) are class
+    attributes.
+
+    Nodes pickle as their whole subtree in the binary format (_tobinary), so
+    the dynamically generated classes never need to be found by name and a
+    pickled AST is as compact as a .ttb file.  Subclasses defined in a module
+    (e.g. Section, DocumentTree) are in the same payload, and only the
+    classes themselves are pickled by reference.
     """
     _constructors = {}
+    _tagIds = {}  # tag -> integer id, assigned in order of constructor creation
+    _trusted = {}  # (tag, keys, lazy keys) -> trusted constructor
+
+    class Lazy(object):
+        """Primitive member that is computed when accessed (e.g. text decoded from a shared buffer)"""
+        __slots__ = ()
+
+        def value(self):
+            raise NotImplementedError
+
+    class Interner(object):
+        """Hash-consing table for TypedTree nodes
+
+        Calling an interner with a node returns the canonical instance of that
+        subtree, so identical subtrees interned by the same table are one
+        object: duplicates take no extra memory and compare equal by identity.
+        Every canonical node and tuple has a structural hash computed once from
+        the hashes of its members (see hash).  Canonical nodes are kept alive by
+        the table until it is dropped.  Nodes that aren't tuples (views) are
+        interned as the plain nodes they show.
+        """
+        __slots__ = ('_canonical', '_hashes')
+
+        def __init__(self):
+            self._canonical = {}  # (class, member tokens) -> canonical node or tuple
+            self._hashes = {}  # id of a canonical node or tuple -> structural hash
+
+        def __len__(self):
+            return len(self._hashes)
+
+        def __contains__(self, x):
+            return id(x) in self._hashes  # canonical objects are alive, so their ids are unique
+
+        def hash(self, x):
+            """Structural hash of a node, tuple or primitive (interning containers first)"""
+            if isinstance(x, (TypedTree.TT, tuple)):
+                return self._hashes[id(self(x))]
+            return hash((type(x), x))
+
+        def __call__(self, x):
+            """Canonical instance of a node or tuple (other values are returned as they are)"""
+            hashes, canonical = self._hashes, self._canonical
+            if not isinstance(x, (TypedTree.TT, tuple)) or id(x) in hashes:
+                return x
+
+            # postorder walk without recursion: containers are interned after their members
+            out = []  # canonical values
+            stack = [(x, False)]
+            while len(stack) > 0:
+                v, expanded = stack.pop()
+                if not isinstance(v, (TypedTree.TT, tuple)) or id(v) in hashes:
+                    out.append(v)
+                elif not expanded:
+                    stack.append((v, True))
+                    stack += [(m, False) for m in reversed(list(v))]  # lazy primitives are resolved
+                else:
+                    members = out[len(out)-len(v):]
+                    del out[len(out)-len(v):]
+                    tokens = tuple([id(m) if isinstance(m, tuple) else (type(m), m) for m in members])
+                    if isinstance(v, tuple):
+                        cls = getattr(type(v), '_resolved', type(v))  # lazy nodes share their plain class
+                    else:  # views (e.g. CmarkNodeView) are replaced by plain nodes
+                        cls = TypedTree.GenerateConstructor(v._tag, tuple(v._fields))
+                    key = (cls, tokens)
+                    c = canonical.get(key)
+                    if c is None:
+                        if cls is type(v) and all(a is b for a, b in zip(members, tuple.__iter__(v))):
+                            c = v
+                        elif isinstance(v, TypedTree.TT):
+                            c = tuple.__new__(cls, members)
+                        else:
+                            c = tuple(members)
+                        member_hashes = tuple([hashes[t] if isinstance(m, tuple) else hash(t)
+                                               for m, t in zip(members, tokens)])
+                        hashes[id(c)] = hash((getattr(c, '_tag', None), getattr(c, '_fields', None), member_hashes))
+                        canonical[key] = c
+                    out.append(c)
+            return out[0]
+
+    class Zipper(object):
+        """Immutable cursor into a TypedTree for a series of local updates
+
+        down(key) focuses a member (a field name or sequence index), up() goes
+        back to the parent, replace(value) changes the focused subtree and
+        root() returns the updated tree.  Parents are only copied when an
+        update is carried up through them, and untouched subtrees are shared
+        with the original tree (see TT._replaceAt).
+        """
+        __slots__ = ('node', '_parent', '_key', '_changed')
+
+        def __init__(self, node, parent=None, key=None, changed=False):
+            self.node = node
+            self._parent = parent
+            self._key = key
+            self._changed = changed
+
+        @property
+        def path(self):
+            keys, z = [], self
+            while z._parent is not None:
+                keys.append(z._key)
+                z = z._parent
+            return tuple(reversed(keys))
+
+        def down(self, key):
+            return TypedTree.Zipper(TypedTree._child(self.node, key), self, key)
+
+        def up(self):
+            if self._parent is None:
+                raise ValueError("Zipper is at the root")
+            if not self._changed:
+                return self._parent
+            node = TypedTree._withChild(self._parent.node, self._key, self.node)
+            return TypedTree.Zipper(node, self._parent._parent, self._parent._key, True)
+
+        def sibling(self, offset):
+            """Focus the sequence member offset places from this one"""
+            return self.up().down(self._key + offset)
+
+        def replace(self, value):
+            return TypedTree.Zipper(TypedTree._convertArg(value), self._parent, self._key, True)
+
+        def root(self):
+            z = self
+            while z._parent is not None:
+                z = z.up()
+            return z.node
 
     class TT(object):
+        __slots__ = ()
 
         def __repr__(self):
             return self._repr(self)
 
         def __eq__(self, other):
+            if self is other:  # shared subtrees, e.g. from an Interner
+                return True
             return isinstance(other, TypedTree.TT) \
                    and self._fields == other._fields \
-                   and all([a == b for a, b in zip(self, other)])
+                   and all(a is b or a == b for a, b in zip(self, other))
+
+        def __reduce__(self):
+            classes = []
+            data = self._tobinary(classes)
+            return _unpickleBinary, (data, tuple(classes)) if len(classes) > 0 else (data,)
+
+        def _getAt(self, path):
+            """Member at a path of field names and sequence indices, e.g. ('nodes', 3, 'children', 0)"""
+            x = self
+            for key in path:
+                x = TypedTree._child(x, key)
+            return x
+
+        def _replaceAt(self, path, value):
+            """Copy of the tree with the member at path (see _getAt) replaced by value
+
+            Only the nodes and tuples on the path from the root are copied and
+            every other subtree is shared with this tree, so an update costs
+            O(depth) copies instead of a rebuild.
+            """
+            spine = [self]
+            for key in path[:-1]:
+                spine.append(TypedTree._child(spine[-1], key))
+            value = TypedTree._convertArg(value)
+            for x, key in zip(reversed(spine), reversed(tuple(path))):
+                value = TypedTree._withChild(x, key, value)
+            return value
 
         def _toobject(self):
             """Convert to an object representation that can be serialized/deserialized"""
@@ -50,14 +422,206 @@ class TypedTree(object):
                 elif isinstance(x, tuple):
                     return [convert(el) for el in x]
                 elif isinstance(x, bytes):
-                    return base64.b64encode(x)
+                    return base64.b64encode(x).decode('ascii')
                 else:
                     return x
             return convert(self)
 
-        def _tojson(self, **kwargs):
+        def _toshapes(self):
+            """Convert to the version 2 object representation (see JSON_VERSION)"""
+            shapes = {}  # (tag, keys) -> index in table
+            out = []  # converted values
+            stack = [(self, False)]
+            while len(stack) > 0:
+                x, expanded = stack.pop()
+                if isinstance(x, TypedTree.TT):  # before tuples: views (CmarkNodeView) aren't tuples
+                    if expanded:
+                        n = len(x._fields)
+                        values = out[len(out)-n:]
+                        del out[len(out)-n:]
+                        out.append([shapes.setdefault((x._tag, tuple(x._fields)), len(shapes))] + values)
+                    else:
+                        stack.append((x, True))
+                        stack += [(v, False) for v in reversed(list(x))]
+                elif isinstance(x, tuple):
+                    if expanded:
+                        values = out[len(out)-len(x):]
+                        del out[len(out)-len(x):]
+                        out.append([-1] + values)
+                    else:
+                        stack.append((x, True))
+                        stack += [(v, False) for v in reversed(x)]
+                elif isinstance(x, bytes):
+                    out.append({'b': base64.b64encode(x).decode('ascii')})
+                else:
+                    out.append(x)
+            return {
+                'version': JSON_VERSION,
+                'shapes': [[tag, list(keys)] for tag, keys in sorted(shapes, key=shapes.get)],
+                'root': out[0],
+            }
+
+        def _tojson(self, version=1, **kwargs):
+            """Serialize to JSON: version 1 (the default) or the compact version 2"""
+            if version == JSON_VERSION:
+                kwargs.setdefault('separators', (',', ':'))
+                return JSON_PREFIX + json.dumps(self._toshapes(), **kwargs) + '}'
             return JSON_PREFIX + json.dumps(self._toobject(), **kwargs) + '}'
 
+        def _writejson(self, f, version=1):
+            """Write the same JSON as _tojson(version) to a text file object without building it in memory"""
+            if version == JSON_VERSION:
+                _writeJSON(f, self._shapechunks())
+            else:
+                _writeJSON(f, self._jsonchunks())
+
+        def _shapes(self):
+            """Shape table of the version 2 representation: (tag, keys) -> index, numbered as in _toshapes"""
+            shapes = {}
+            stack = [(self, False)]
+            while len(stack) > 0:
+                x, expanded = stack.pop()
+                if isinstance(x, TypedTree.TT):
+                    if expanded:
+                        shapes.setdefault((x._tag, tuple(x._fields)), len(shapes))
+                    else:
+                        stack.append((x, True))
+                        stack += [(v, False) for v in reversed(list(x))]
+                elif isinstance(x, tuple):
+                    stack += [(v, False) for v in reversed(x)]
+            return shapes
+
+        def _shapechunks(self):
+            """Generate the version 2 JSON representation (without JSON_PREFIX) in pieces
+
+            The shape table comes first, so it is collected in a first pass
+            over the tree and the values are written in a second one.
+            """
+            shapes = self._shapes()
+            table = [[tag, list(keys)] for tag, keys in sorted(shapes, key=shapes.get)]
+            dumps = lambda x: json.dumps(x, separators=(',', ':'))
+            yield '{"version":' + dumps(JSON_VERSION) + ',"shapes":' + dumps(table) + ',"root":'
+            stack = [(False, self)]  # (is raw text, value) in reverse output order
+            while len(stack) > 0:
+                raw, x = stack.pop()
+                if raw:
+                    yield x
+                elif isinstance(x, (TypedTree.TT, tuple)):
+                    values = list(x)
+                    index = shapes[(x._tag, tuple(x._fields))] if isinstance(x, TypedTree.TT) else -1
+                    yield '[' + str(index)
+                    stack.append((True, ']'))
+                    for v in reversed(values):
+                        stack.append((False, v))
+                        stack.append((True, ','))
+                elif isinstance(x, bytes):
+                    yield dumps({'b': base64.b64encode(x).decode('ascii')})
+                else:
+                    yield dumps(x)
+            yield '}'
+
+        def _jsonchunks(self):
+            """Generate the JSON representation of a node (without JSON_PREFIX) in pieces"""
+            stack = [(False, self)]  # (is raw text, value) in reverse output order
+            while len(stack) > 0:
+                raw, x = stack.pop()
+                if raw:
+                    yield x
+                elif isinstance(x, TypedTree.TT):
+                    values = list(x)
+                    yield '{"t": ' + json.dumps(x._tag) + ', "k": ' + json.dumps(list(x._fields)) + ', "v": ['
+                    stack.append((True, '], "b": ' + json.dumps([k for k, v in zip(x._fields, values) if isinstance(v, bytes)]) + '}'))
+                    for i in reversed(range(len(values))):
+                        stack.append((False, values[i]))
+                        if i > 0:
+                            stack.append((True, ', '))
+                elif isinstance(x, tuple):
+                    yield '['
+                    stack.append((True, ']'))
+                    for i in reversed(range(len(x))):
+                        stack.append((False, x[i]))
+                        if i > 0:
+                            stack.append((True, ', '))
+                elif isinstance(x, bytes):
+                    yield json.dumps(base64.b64encode(x).decode('ascii'))
+                else:
+                    yield json.dumps(x)
+
+        def _tobinary(self, classes=None):
+            """Serialize to the binary format read by TypedTree._frombinary
+
+            If classes is a list, the module-level subclasses of the nodes
+            (e.g. Section) are appended to it, to be passed to _frombinary.
+            """
+            strings, schemas = {}, {}  # value -> index in table
+            shapes = {}  # (tag, fields) -> schema index, so each node shape is only looked up once
+            def string(x):
+                if x not in strings:
+                    strings[x] = len(strings)
+                return strings[x]
+
+            # postorder walk without recursion: expanded containers are emitted after their members
+            ops = bytearray()
+            stack = [(self, False)]
+            while len(stack) > 0:
+                x, expanded = stack.pop()
+                if isinstance(x, TypedTree.TT):
+                    if expanded:
+                        shape = (x._tag, x._fields)
+                        if shape not in shapes:
+                            schema = (string(x._tag),) + tuple([string(k) for k in x._fields])
+                            shapes[shape] = schemas.setdefault(schema, len(schemas))
+                            if classes is not None and TypedTree._isModuleClass(type(x)):
+                                classes.append(type(x))
+                        ops.append(OP_NODE)
+                        _putVarint(ops, shapes[shape])
+                    else:
+                        stack.append((x, True))
+                        stack += [(v, False) for v in reversed(list(x))]
+                elif isinstance(x, tuple):
+                    if expanded:
+                        ops.append(OP_TUPLE)
+                        _putVarint(ops, len(x))
+                    else:
+                        stack.append((x, True))
+                        stack += [(v, False) for v in reversed(x)]
+                elif x is None:
+                    ops.append(OP_NONE)
+                elif x is True or x is False:
+                    ops.append(OP_TRUE if x else OP_FALSE)
+                elif isinstance(x, float):
+                    ops.append(OP_FLOAT)
+                    ops += struct.pack('<d', x)
+                elif isinstance(x, bytes):  # before text: python 2 str is bytes, as in _toobject
+                    ops.append(OP_BYTES)
+                    _putVarint(ops, len(x))
+                    ops += x
+                elif isinstance(x, str) or not PY3 and isinstance(x, unicode):
+                    ops.append(OP_STR)
+                    _putVarint(ops, string(x))
+                else:  # int
+                    zigzag = 2*x if x >= 0 else -2*x-1
+                    if zigzag < 0x100 - OP_SMALL_INT:
+                        ops.append(OP_SMALL_INT + zigzag)
+                    else:
+                        ops.append(OP_INT)
+                        _putVarint(ops, zigzag)
+
+            # assemble tables and op stream
+            out = bytearray(BINARY_MAGIC)
+            _putVarint(out, BINARY_VERSION)
+            _putVarint(out, len(strings))
+            for x in sorted(strings, key=strings.get):
+                x = x.encode('utf-8')
+                _putVarint(out, len(x))
+                out += x
+            _putVarint(out, len(schemas))
+            for schema in sorted(schemas, key=schemas.get):
+                _putVarint(out, len(schema) - 1)
+                for i in schema:
+                    _putVarint(out, i)
+            return bytes(out + ops)
+
         @classmethod
         def _repr(T, x, i=1, ts=4):
             if isinstance(x, TypedTree.TT):
@@ -74,34 +638,290 @@ class TypedTree(object):
                 assert TypedTree._isPrimitive(x)
                 return x.__repr__()
 
+    @classmethod
+    def _jsonobject(cls, o):
+        """json object_hook that rebuilds a TypedTree node"""
+        if 't' not in o:  # version 2 header or bytes value
+            return o
+        type_name = str(o['t'])  # TypedTree type name as a string
+        entries = {}
+        for k, v in zip(o['k'], o['v']):
+            if k in o['b']:
+                v = base64.b64decode(v)
+            entries[str(k)] = v
+        return cls.Build(type_name, **entries)
+
     @classmethod
     def _fromjson(cls, x):
-        def fromObject(o):
-            type_name = str(o['t'])  # TypedTree type name as a string
-            entries = {}
-            for k, v in zip(o['k'], o['v']):
-                if k in o['b']:
-                    v = base64.b64decode(v)
-                entries[str(k)] = v
-            return cls.Build(type_name, **entries)
+        """Rebuild a TypedTree from a string written by _tojson (either version)"""
         if cls._isSeralizedData(x):
-            return json.loads(x[len(JSON_PREFIX):-1], object_hook=fromObject)
+            o = json.loads(x[len(JSON_PREFIX):-1], object_hook=cls._jsonobject)
+            if isinstance(o, dict):
+                return cls._shapeDecoder(o.get('version'), o['shapes'])(o['root'])
+            return o
         else:
             raise ValueError("Not a serialized TypedTree!")
 
+    @classmethod
+    def _shapeDecoder(cls, version, shapes):
+        """Function that rebuilds values in their version 2 JSON form given the shape table"""
+        if version != JSON_VERSION:
+            raise ValueError("Unsupported TypedTree JSON version: {}".format(version))
+        makers = [cls.Trusted(str(tag), [str(k) for k in keys]) for tag, keys in shapes]
+        def decode(x):
+            if isinstance(x, dict):
+                return base64.b64decode(x['b'])
+            elif not isinstance(x, list):
+                return x
+            stack = [(x, [])]  # arrays being converted and their converted members
+            while True:
+                arr, values = stack[-1]
+                i, n = len(values) + 1, len(arr)
+                while i < n:
+                    v = arr[i]
+                    if isinstance(v, list):
+                        break
+                    values.append(base64.b64decode(v['b']) if isinstance(v, dict) else v)
+                    i += 1
+                if i < n:
+                    stack.append((arr[i], []))
+                    continue
+                stack.pop()
+                v = tuple(values) if arr[0] < 0 else makers[arr[0]](*values)
+                if len(stack) == 0:
+                    return v
+                stack[-1][1].append(v)
+        return decode
+
+    @classmethod
+    def _writejsonstream(cls, f, tag, nodes, field='nodes'):
+        """Write a tag node whose only field is a sequence of nodes as JSON while the nodes are generated
+
+        The output is the same as Build(tag, **{field: nodes})._tojson(), but
+        only one node from the nodes iterable is held at a time.  Only version 1
+        is written this way, as version 2 needs its shape table up front.
+        """
+        def chunks():
+            yield '{"t": ' + json.dumps(tag) + ', "k": ' + json.dumps([field]) + ', "v": [['
+            for i, node in enumerate(nodes):
+                if i > 0:
+                    yield ', '
+                for chunk in node._jsonchunks():
+                    yield chunk
+            yield ']], "b": []}'
+        _writeJSON(f, chunks())
+
+    @classmethod
+    def _iterjson(cls, f):
+        """Generate the top-level nodes of a JSON serialized TypedTree from a file object
+
+        f is a text or binary file object, or an iterable of str chunks (e.g.
+        lines with line endings).  The members of the root node's sequence
+        fields (the nodes of a Document) are decoded and yielded one at a
+        time, so memory is bounded by the largest top-level node.  Version 2
+        data with the root before its header is decoded whole instead.
+        """
+        decode, version, shapes, root = None, None, None, None
+        for event in _JSONReader(f, cls).root():
+            if event[0] == 'item':
+                yield event[2] if decode is None else decode(event[2])
+            elif event[0] == 'field' and event[1] == 'version':
+                version = event[2]
+            elif event[0] == 'field' and event[1] == 'shapes':
+                shapes = event[2]
+            elif event[0] == 'field' and event[1] == 'shape':
+                decode = cls._shapeDecoder(version, shapes)
+            elif event[0] == 'field' and event[1] == 'root':
+                root = event[2]
+        if root is not None:
+            for x in cls._shapeDecoder(version, shapes)(root):
+                if isinstance(x, tuple) and not isinstance(x, TypedTree.TT):
+                    for node in x:
+                        yield node
+
+    @classmethod
+    def _readjson(cls, f):
+        """Read a JSON serialized TypedTree from a file object (see _iterjson) without reading it all first"""
+        tag, keys, binary, values = None, None, [], {}
+        version, shapes, root, decode = None, None, None, lambda x: x
+        for event in _JSONReader(f, cls).root():
+            if event[0] == 'field':
+                if event[1] == 't':
+                    tag = str(event[2])
+                elif event[1] == 'k':
+                    keys = [str(k) for k in event[2]]
+                elif event[1] == 'b':
+                    binary = event[2]
+                elif event[1] == 'version':
+                    version = event[2]
+                elif event[1] == 'shapes':
+                    shapes = event[2]
+                elif event[1] == 'root':  # before the header, so read whole
+                    root = event[2]
+                elif event[1] == 'shape':
+                    decode = cls._shapeDecoder(version, shapes)
+                    tag = str(shapes[event[2]][0])
+                    keys = [str(k) for k in shapes[event[2]][1]]
+            elif event[0] == 'item':
+                values.setdefault(event[1], []).append(decode(event[2]))
+            elif event[0] == 'value':
+                values[event[1]] = decode(event[2])
+            else:  # start of a sequence member
+                values[event[1]] = []
+        if root is not None:
+            return cls._shapeDecoder(version, shapes)(root)
+        entries = dict([(k, values[i]) for i, k in enumerate(keys)])
+        for k in binary:
+            entries[str(k)] = base64.b64decode(entries[str(k)])
+        return cls.Build(tag, **entries)
+
+    @classmethod
+    def _frombinary(cls, data, classes=()):
+        """Rebuild a TypedTree from bytes or a buffer (e.g. an mmap) written by _tobinary
+
+        Nodes with the tag and fields of one of the given module-level
+        subclasses (see _tobinary) are rebuilt as instances of that class.
+        """
+        subclasses = dict([((c._tag, tuple(c._fields)), c) for c in classes])
+        if not cls._isBinaryData(data):
+            raise ValueError("Not a binary serialized TypedTree!")
+        view = memoryview(data) if PY3 else bytearray(data)
+        try:
+            version, pos = _getVarint(view, len(BINARY_MAGIC))
+            if version != BINARY_VERSION:
+                raise ValueError("Unsupported TypedTree binary version: {}".format(version))
+
+            # string and schema tables
+            n, pos = _getVarint(view, pos)
+            strings = []
+            for _ in range(n):
+                length, pos = _getVarint(view, pos)
+                strings.append(bytes(view[pos:pos+length]).decode('utf-8'))
+                pos += length
+            n, pos = _getVarint(view, pos)
+            schemas = []  # (number of fields, constructor)
+            for _ in range(n):
+                n_keys, pos = _getVarint(view, pos)
+                tag, pos = _getVarint(view, pos)
+                keys = []
+                for _ in range(n_keys):
+                    k, pos = _getVarint(view, pos)
+                    keys.append(str(strings[k]))
+                sub = subclasses.get((str(strings[tag]), tuple(keys)))
+                if sub is not None:  # values are in the order of the subclass fields
+                    schemas.append((n_keys, _subclassConstructor(sub)))
+                else:
+                    schemas.append((n_keys, cls.Trusted(str(strings[tag]), keys)))
+
+            # op stream
+            stack = []
+            push = stack.append
+            end = len(view)
+            while pos < end:
+                op = view[pos]
+                pos += 1
+                if op >= OP_SMALL_INT:
+                    i = op - OP_SMALL_INT
+                    push(i // 2 if i % 2 == 0 else -(i+1) // 2)
+                elif op == OP_NODE or op == OP_TUPLE or op == OP_STR or op == OP_INT:
+                    i = view[pos]  # inline single-byte varint
+                    if i < 0x80:
+                        pos += 1
+                    else:
+                        i, pos = _getVarint(view, pos)
+                    if op == OP_NODE:
+                        n, make = schemas[i]
+                        if n > 0:
+                            values = stack[-n:]
+                            del stack[-n:]
+                            push(make(*values))
+                        else:
+                            push(make())
+                    elif op == OP_STR:
+                        push(strings[i])
+                    elif op == OP_TUPLE:
+                        if i > 0:
+                            values = tuple(stack[-i:])
+                            del stack[-i:]
+                            push(values)
+                        else:
+                            push(())
+                    else:
+                        push(i // 2 if i % 2 == 0 else -(i+1) // 2)
+                elif op == OP_NONE:
+                    push(None)
+                elif op == OP_FALSE or op == OP_TRUE:
+                    push(op == OP_TRUE)
+                elif op == OP_FLOAT:
+                    push(struct.unpack('<d', bytes(view[pos:pos+8]))[0])
+                    pos += 8
+                elif op == OP_BYTES:
+                    length, pos = _getVarint(view, pos)
+                    push(bytes(view[pos:pos+length]))
+                    pos += length
+                else:
+                    raise ValueError("Invalid TypedTree binary op: {}".format(op))
+            if len(stack) != 1:
+                raise ValueError("Corrupt TypedTree binary data")
+            return stack[0]
+        finally:
+            if PY3:
+                view.release()  # mmaps can't be closed while exported
+
+    @classmethod
+    def _loadbinary(cls, filename):
+        """Memory-map a file written with _tobinary and rebuild the TypedTree"""
+        with open(filename, 'rb') as F:
+            m = mmap.mmap(F.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls._frombinary(m)
+        finally:
+            m.close()
+
     @classmethod
     def _convertArg(T, a):
-        if T._isPrimitive(a) or isinstance(a, T.TT):
+        if T._isPrimitive(a) or isinstance(a, (T.TT, T.Lazy)):
             return a
         elif hasattr(a, '__iter__'):
             return tuple([T._convertArg(x) for x in a])
         else:
             raise RuntimeError("Invalid value type: {}".format(a))
 
+    @staticmethod
+    def _child(x, key):
+        """Member of a node (by field name or index) or a tuple (by index)"""
+        if isinstance(key, str):
+            if not isinstance(x, TypedTree.TT):
+                raise KeyError(key)
+            return x[x._fields.index(key)]
+        return x[key]
+
+    @staticmethod
+    def _withChild(x, key, value):
+        """Copy of a node or tuple with one member replaced (other members are shared)"""
+        if isinstance(key, str):
+            key = x._fields.index(key)
+        if not isinstance(x, tuple):  # views (e.g. ShiftedNode) are replaced by plain nodes
+            values = list(x)
+            values[key] = value
+            return tuple.__new__(TypedTree.GenerateConstructor(x._tag, tuple(x._fields)), values)
+        values = list(tuple.__iter__(x))  # lazy primitives are kept as they are
+        values[key] = value
+        return tuple.__new__(type(x), values) if isinstance(x, TypedTree.TT) else tuple(values)
+
+    @staticmethod
+    def _isModuleClass(cls):
+        """True for a node class defined in a module (e.g. Section) rather than generated"""
+        return issubclass(cls, tuple) and '_tag' not in cls.__dict__ and '_resolved' not in cls.__dict__
+
     @staticmethod
     def _isSeralizedData(x):
         return x.startswith(JSON_PREFIX) and x.endswith('}')
 
+    @staticmethod
+    def _isBinaryData(x):
+        return x[:len(BINARY_MAGIC)] == BINARY_MAGIC
+
     @staticmethod
     def _isPrimitive(x):
         return x is None or any([isinstance(x,t) for t in PRIMITIVES])
@@ -116,19 +936,77 @@ class TypedTree(object):
             return x
 
     @classmethod
-    def GenerateConstructor(T, tag, keys):
+    def GenerateConstructor(T, tag, keys, lazy=()):
+        if len(lazy) > 0:
+            return T._lazyConstructor(tag, keys, lazy)
         key = (tag, tuple(keys))
         if key not in T._constructors:
-            class Inner(namedtuple(tag, keys)):
-                def __new__(self, **kwargs):  # modifying behavior of an immutable class so need a __new__ method
-                    if not isinstance(tag, str):
-                        raise ValueError("TypedTree type name not a string: {}".format(tag))
-                    self._tag = tag
-                    return super(Inner,self).__new__(self, **dict([(k,T._convertArg(v)) for k,v in kwargs.items()]))
-            T._constructors[key] = type(tag, (T.TT,Inner), {})  # type name, super-types, namespace dictionary
+            if not isinstance(tag, str):
+                raise ValueError("TypedTree type name not a string: {}".format(tag))
+            tag = intern_string(tag)
+            base = namedtuple(tag, keys)
+            def __new__(cls, **kwargs):  # modifying behavior of an immutable class so need a __new__ method
+                for k, v in kwargs.items():  # values are replaced in place, so no new dict is needed
+                    if not isinstance(v, (T.TT, T.Lazy)) and type(v) not in PRIMITIVES and v is not None:
+                        kwargs[k] = T._convertArg(v)
+                return base.__new__(cls, **kwargs)
+            namespace = {
+                '__slots__': (),
+                '__new__': __new__,
+                '_tag': tag,
+                '_tagId': T._tagIds.setdefault(tag, len(T._tagIds)),
+            }
+            T._constructors[key] = type(tag, (T.TT, base), namespace)  # type name, super-types, namespace dictionary
+        return T._constructors[key]
+
+    @classmethod
+    def _lazyConstructor(T, tag, keys, lazy):
+        """Subclass of a constructor that resolves lazy primitives in the given fields on access"""
+        key = (tag, tuple(keys), tuple(lazy))
+        if key not in T._constructors:
+            base = T.GenerateConstructor(tag, keys)
+            def resolve(x):
+                return x.value() if isinstance(x, T.Lazy) else x
+            def getitem(self, i):
+                if isinstance(i, slice):
+                    return tuple([resolve(x) for x in tuple.__getitem__(self, i)])
+                return resolve(tuple.__getitem__(self, i))
+            namespace = {
+                '__slots__': (),
+                '__iter__': lambda self: (resolve(x) for x in tuple.__iter__(self)),
+                '__getitem__': getitem,
+                '__getslice__': lambda self, i, j: getitem(self, slice(i, j)),  # python 2
+                '_resolved': base,  # class of the node with its lazy primitives resolved
+            }
+            for k in lazy:
+                namespace[k] = property(lambda self, i=list(keys).index(k): resolve(tuple.__getitem__(self, i)))
+            T._constructors[key] = type(tag, (base,), namespace)
         return T._constructors[key]
 
     @classmethod
     def Build(Class, tag, **kwargs):
         args = dict([(Class._sanitize(k),v) for k,v in kwargs.items()])
-        return Class.GenerateConstructor(Class._sanitize(tag), sorted(args.keys()))(**args)
\ No newline at end of file
+        lazy = sorted([k for k, v in args.items() if isinstance(v, Class.Lazy)])
+        return Class.GenerateConstructor(Class._sanitize(tag), sorted(args.keys()), lazy)(**args)
+
+    @classmethod
+    def Trusted(T, tag, keys, lazy=()):
+        """Constructor for data that is already well-formed
+
+        Returns a function that builds a tag node from member values given
+        positionally in the order of keys.  Nothing is sanitized or converted:
+        keys must be valid field names, values must be valid members (tuples,
+        not lists) and lazy must name the fields holding TypedTree.Lazy
+        values.  The nodes are the same as the ones Build would return.
+        """
+        key = (tag, tuple(keys), tuple(lazy))
+        if key not in T._trusted:
+            fields = sorted(keys)
+            cls = T.GenerateConstructor(tag, fields, sorted(lazy))
+            new = tuple.__new__
+            if list(keys) == fields:
+                T._trusted[key] = lambda *values: new(cls, values)
+            else:
+                order = [list(keys).index(k) for k in fields]
+                T._trusted[key] = lambda *values: new(cls, [values[i] for i in order])
+        return T._trusted[key]
@@ -2,6 +2,9 @@ from pycmark.taggedtext.render.VimRenderer import VimRenderer, StringIO
 from pycmark.util.TypedTree import TypedTree
 from pycmark.taggedtext.TaggedCmarkDocument import TaggedTextDocument
 
+# extension of binary AST files (see TypedTree._tobinary)
+BINARY_EXTENSION = '.ttb'
+
 class VimHandler(object):
     """Helper class for vim operations"""
 
@@ -24,23 +27,22 @@ class VimHandler(object):
         self.renderer = VimRenderer()  # rendering object
 
     def parseJSON(self):
-        inData = '\n'.join(self.vim.current.buffer)
-        if TypedTree._isSeralizedData(inData):
-            try:
-                self.tt = TypedTree._fromjson(inData)
-            except:
-                self.vim.command('let g:json_load_ok = 0')
-                return
-            self.inData = inData
-            self.vim.command('only')  # ???
-            self.vim.command('bd')    # ???
-            self.contentBuffer = self.vim.current.buffer.number
-            for line in self.renderer.genStyle().split('\n'):
-                self.vim.command(line)
-            self.vim.command('let g:json_load_ok = 1')
-        else:
+        name = self.vim.current.buffer.name
+        if name is not None and name.endswith(BINARY_EXTENSION):  # memory-mapped from the file
+            load = lambda: TypedTree._loadbinary(name)
+        else:  # streamed from the buffer lines without joining them
+            load = lambda: TypedTree._readjson(line + '\n' for line in self.vim.current.buffer)
+        try:
+            self.tt = load()
+        except:
             self.vim.command('let g:json_load_ok = 0')
             return
+        self.vim.command('only')  # ???
+        self.vim.command('bd')    # ???
+        self.contentBuffer = self.vim.current.buffer.number
+        for line in self.renderer.genStyle().split('\n'):
+            self.vim.command(line)
+        self.vim.command('let g:json_load_ok = 1')
 
     def RenderText(self):
         contentWindow = [w for w in self.vim.windows if w.buffer.number == self.contentBuffer][0]
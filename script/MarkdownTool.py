@@ -9,7 +9,7 @@ import subprocess
 import pycmark.cmarkgfm as cmark
 from pycmark.taggedtext.TaggedCmarkDocument import TaggedTextDocument
 from pycmark.taggedtext.render.TerminalRenderer import TerminalRenderer
-from pycmark.util.TypedTree import TypedTree
+from pycmark.util.TypedTree import TypedTree, JSON_VERSION
 from pycmark.html.HTML_Generator import toStyledHTML
 
 ################################################################################
@@ -74,6 +74,7 @@ Valid actions (default is RenderTerminal):
     - AST             Generate human-readable AST representation of document
     - JSON            Generate compact JSON export of document AST
     - JSONPP          Generate expanded JSON export of document AST
+    - Binary          Generate compact binary export of document AST (.ttb)
     
 If an input file isn't given the internal test document is used as a source
 '''
@@ -95,20 +96,29 @@ if __name__ == '__main__':
     if args.auto_width:
         args.width = int(subprocess.check_output(['tput', 'cols']))
 
+    # special case: process a binary AST or tagged text json (streamed, not read first) and render to stdout
+    isBinary = args.infile is not None and args.infile.endswith('.ttb')
+    isJSON = False
+    if args.infile is not None and args.infile.endswith('.json'):
+        with open(args.infile, 'rt') as F:
+            isJSON = F.read(1) == '{'
+    if isBinary or isJSON:
+        if isBinary:
+            tt = TypedTree._loadbinary(args.infile)
+        else:
+            with open(args.infile, 'rt') as F:
+                tt = TypedTree._readjson(F)
+        signal.signal(signal.SIGPIPE, sigpipe_handler)
+        doc = TaggedTextDocument.fromAST(tt, width=args.width)
+        doc.render(TerminalRenderer().render)
+        sys.exit(0)
+
     # read input data
     if args.infile is not None:
         txt = open(args.infile, 'rt').read()
     else:
         txt = TEST_TEXT
 
-    # special case: process tagged text json and render to stdout
-    if args.infile is not None and args.infile.endswith('.json') and txt[0] == '{':
-        tt = TypedTree._fromjson(txt)
-        signal.signal(signal.SIGPIPE, sigpipe_handler)
-        doc = TaggedTextDocument.fromAST(tt, width=args.width)
-        doc.render(TerminalRenderer().render)
-        sys.exit(0)
-
     # output writer
     if args.outfile is not None:
         writer = open(args.outfile, 'wt')
@@ -127,14 +137,17 @@ if __name__ == '__main__':
     elif args.action == 'HTML':
         writer.write(toStyledHTML(txt) + '\n')
     elif args.action == 'Latex':
-        writer.write(cmark.mdToLatex(txt) + '\n')
+        writer.write(cdoc.toLatex() + '\n')
     elif args.action == 'AST':
         writer.write(cdoc.toAST().__repr__() + '\n')
     elif args.action == 'JSON':
-        writer.write(cdoc.toAST()._tojson() + '\n')
+        cdoc.toAST()._writejson(writer, version=JSON_VERSION)
+        writer.write('\n')
     elif args.action == 'JSONPP':
         writer.write(cdoc.toAST()._tojson(sort_keys=True, indent=4, separators=(',', ': ')) + '\n')
+    elif args.action == 'Binary':
+        writer.buffer.write(cdoc.toAST()._tobinary())  # text writers wrap a binary buffer
     else:
-        sys.stderr.write("Valid actions: RenderTerminal, SimpleHTML, HTML, Latex, AST, JSON, JSONPP\n")
+        sys.stderr.write("Valid actions: RenderTerminal, SimpleHTML, HTML, Latex, AST, JSON, JSONPP, Binary\n")
         sys.exit(1)
 
@@ -0,0 +1,659 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import gc
+import os
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import pycmark.cmarkgfm as cmark
+
+################################################################################
+
+SAMPLE = os.path.join(os.path.dirname(os.path.realpath(cmark.__file__)), 'sample.md')
+
+HELP_TEXT = '''Benchmarks and soak checks for pycmark
+
+Valid actions:
+    - Soak            Parse and render repeatedly and verify that process memory stays flat
+    - Parse           Time parsing through a new parser per call vs. a reused parser handle
+    - Import          Measure cold-start cost of importing pycmark.cmarkgfm
+    - Threads         Time parseMany, mdToLatexMany and parseSharded for 1 to N threads and report the speedup
+    - Lazy            Time heading extraction from an eager AST vs. a lazy node view
+    - Events          Walk deeply nested block quotes with events() beyond the recursion limit
+    - Reparse         Time a one-line edit with a full parse vs. CmarkDocument.reparse
+    - Pathological    Check that unterminated LaTeX openers parse in linear time
+    - AST             Time toAST through compiled accessors, the flat record buffer and ctypes
+    - Lean            Compare AST object count and memory for the toAST positions/literals modes
+    - Shards          Check parseSharded against a whole-document parse on a corpus and time both
+    - Outline         Time the vim TOC from a full AST vs. the heading outline
+    - Nodes           Report memory and build time per TypedTree AST node
+    - Build           Time rebuilding an AST with TypedTree.Build vs. TypedTree.Trusted
+    - Serialize       Compare size and load time of the JSON and binary AST formats
+    - Stream          Compare peak memory of whole-string and streaming JSON export and import
+    - Schema          Compare size and decode time of the version 1 and compact version 2 JSON schemas
+    - Intern          Compare memory and equality time of plain and hash-consed ASTs
+    - Diff            Time the edit script between an AST and its incremental reparse after a one-line edit
+    - Update          Time replacing the deepest AST node by rebuilding vs. path copying
+    - Pickle          Time pickle round trips of an AST and a DocumentTree and ASTs from a process pool
+
+If an input file isn't given the cmarkgfm sample document is used as a source
+'''
+
+################################################################################
+
+def peakRSS():
+    """Peak resident set size in KB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def timed(fn, *args, **kwargs):
+    """Run a function and return (result, elapsed seconds)"""
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, time.perf_counter() - t0
+
+def report(label, elapsed, n=1):
+    print('{:<40} {:>10.3f} ms {:>12.1f} us/iter'.format(label, elapsed * 1e3, elapsed * 1e6 / n))
+
+################################################################################
+
+def soak(txt, iterations, tolerance=0.05):
+    """Parse documents repeatedly and fail if peak memory keeps growing"""
+
+    def run(n):
+        for i in range(n):
+            if i % 2 == 0:  # explicit release
+                with cmark.parse(txt) as doc:
+                    doc.toAST()
+                    doc.toHTML()
+            else:  # release by finalizer
+                doc = cmark.parse(txt)
+                doc.toAST()
+                doc.toHTML()
+                del doc
+
+    # warm up so that allocator pools and caches reach steady state
+    run(max(iterations // 10, 10))
+    before = peakRSS()
+    _, elapsed = timed(run, iterations)
+    after = peakRSS()
+
+    report('parse + toAST + toHTML', elapsed, iterations)
+    print('peak RSS: {} KB -> {} KB'.format(before, after))
+    if after > before * (1 + tolerance) + 1024:
+        sys.stderr.write('Memory grew by {} KB over {} iterations\n'.format(after - before, iterations))
+        return False
+    return True
+
+def benchParse(txt, iterations):
+    """Compare per-call parser setup with a reusable parser handle"""
+    def run(parse):
+        for _ in range(iterations):
+            parse(txt).close()
+    parser = cmark.CmarkParser()
+    _, t_new = timed(run, cmark.CmarkDocument)
+    _, t_reuse = timed(run, parser.parse)
+    report('CmarkDocument(txt)', t_new, iterations)
+    report('CmarkParser.parse(txt)', t_reuse, iterations)
+    return True
+
+def importTime(module, repeat=5):
+    """Best-of-n cumulative import time (us) of a module in a fresh interpreter"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(cmark.__file__))))
+    env = dict(os.environ, PYTHONPATH=root)
+    best = None
+    for _ in range(repeat):
+        P = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                           env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        for line in P.stderr.splitlines():
+            m = re.match(r'import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)\s*$', line)
+            if m and m.group(2) == module:
+                best = int(m.group(1)) if best is None else min(best, int(m.group(1)))
+    return best
+
+def benchImport():
+    """Cold-start cost of the lazily bound package vs. the full generated binding"""
+    for module in ['pycmark.cmarkgfm', 'pycmark.cmarkgfm.cmarkgfm']:
+        print('{:<40} {:>10.3f} ms'.format('import ' + module, importTime(module) / 1e3))
+    return True
+
+def benchThreads(txt, iterations, workers=None, copies=20):
+    """Compare serial and thread pool batch parsing and conversion, and report thread scaling"""
+    workers = workers or os.cpu_count()
+    txts = [txt] * iterations
+    big = '\n'.join([stripDefinitions(txt)] * copies)
+    serial = {}
+    for n in sorted({1, workers} | {2**i for i in range(1, 5) if 2**i < workers}):
+        docs, t_parse = timed(cmark.parseMany, txts, workers=n)
+        report('parseMany (workers={})'.format(n), t_parse, iterations)
+        for doc in docs:
+            doc.close()
+        _, t_latex = timed(cmark.mdToLatexMany, txts, workers=n)
+        report('mdToLatexMany (workers={})'.format(n), t_latex, iterations)
+        _, t_shards = timed(cmark.parseSharded, big, workers=n)
+        report('parseSharded (workers={}, {} KB)'.format(n, len(big) // 1024), t_shards)
+        serial = serial or {'parse': t_parse, 'latex': t_latex, 'shards': t_shards}
+        print('    speedup over 1 worker: parseMany {:.2f}x, mdToLatexMany {:.2f}x, parseSharded {:.2f}x'.format(
+            serial['parse'] / t_parse, serial['latex'] / t_latex, serial['shards'] / t_shards))
+    return True
+
+def benchLazy(txt, iterations):
+    """Compare heading extraction from a full AST with a lazy node view"""
+    def headings(lazy):
+        for _ in range(iterations):
+            with cmark.parse(txt) as doc:
+                tt = doc.toAST(lazy=lazy)
+                out = [n.Level for n in tt.nodes if n._tag == 'heading']
+        return out
+    (h_eager, t_eager), (h_lazy, t_lazy) = timed(headings, False), timed(headings, True)
+    report('toAST() headings', t_eager, iterations)
+    report('toAST(lazy=True) headings', t_lazy, iterations)
+    return h_eager == h_lazy
+
+def checkEvents(depth=None):
+    """Stream events for a document nested deeper than the Python recursion limit"""
+    depth = depth or 2 * sys.getrecursionlimit()
+    with cmark.parse('> ' * depth + 'text\n') as doc:
+        (n_enter, n_exit), elapsed = timed(lambda: (
+            sum(1 for ev, tag, _ in doc.events() if ev == 'enter' and tag == 'block_quote'),
+            sum(1 for ev, _, _ in doc.events() if ev == 'exit')))
+    report('events() at depth {}'.format(depth), elapsed)
+    return n_enter == depth and n_exit == depth + 3  # + document, paragraph, text
+
+def benchReparse(txt, iterations, copies=20):
+    """Compare full reparsing with incremental reparsing for a one-line edit"""
+    lines = txt.splitlines() * copies
+    with cmark.parse('\n'.join(lines) + '\n') as doc:
+        tt = doc.toAST()
+    line = len(lines) // 2
+    edit = [lines[line-1] + ' edited']
+
+    def full():
+        for _ in range(iterations):
+            with cmark.parse('\n'.join(lines[:line-1] + edit + lines[line:]) + '\n') as doc:
+                out = doc.toAST()
+        return out
+    # SourceLines are edited in place, so each iteration makes the edit and undoes it
+    source, tt = cmark.CmarkDocument.reparse(tt, lines, 1, 0, [])
+    def incremental():
+        out = tt
+        for _ in range(iterations):
+            _, out = cmark.CmarkDocument.reparse(out, source, line, line, edit)
+            _, out = cmark.CmarkDocument.reparse(out, source, line, line, [lines[line-1]])
+        return cmark.CmarkDocument.reparse(out, source, line, line, edit)[1]
+    def inserted():
+        out = tt_inc
+        for _ in range(iterations):
+            _, out = cmark.CmarkDocument.reparse(out, source, line, line-1, edit)
+            _, out = cmark.CmarkDocument.reparse(out, source, line, line, [])
+        return out
+    (tt_full, t_full), (tt_inc, t_inc) = timed(full), timed(incremental)
+    report('parse + toAST ({} lines)'.format(len(lines)), t_full, iterations)
+    report('CmarkDocument.reparse', t_inc, 2*iterations+1)
+    ok = tt_full == tt_inc
+
+    # edits that change the line count shift the blocks after them (source is now edited)
+    tt_ins, t_ins = timed(inserted)
+    report('CmarkDocument.reparse (line inserted and removed)', t_ins, 2*iterations)
+    return ok and tt_ins == tt_full
+
+def checkPathological(sizes=(2000, 4000, 8000, 16000), tolerance=3.0):
+    """Parse a paragraph of unterminated inline LaTeX openers and check that cost per opener stays flat"""
+    per_opener = []
+    for n in sizes:
+        doc, elapsed = timed(cmark.parse, '\\\\( ' * n + '\n')
+        doc.close()
+        report('\\\\( openers (n={})'.format(n), elapsed, n)
+        per_opener.append(elapsed / n)
+    if per_opener[-1] > tolerance * per_opener[0]:
+        sys.stderr.write('Parse time grows faster than linearly with the number of openers\n')
+        return False
+    return True
+
+# two tables with different alignments: header cells of the second table
+# must use its own alignments, not continue the first table's column count
+TWO_TABLES = '| a | b | c |\n|:--|:-:|--:|\n| 1 | 2 | 3 |\n\n| d | e |\n|--:|:--|\n| 4 | 5 |\n'
+
+def benchAST(txt, iterations):
+    """Compare the AST generation paths of CmarkDocument.toAST"""
+    from pycmark.cmarkgfm import bindings
+    def astPaths(doc):
+        paths = [('ctypes events', doc._eventsToAST)]
+        if hasattr(bindings, 'document_to_ast'):
+            paths.append(('flat record buffer', lambda: doc._recordsToAST(doc._exportAST())))
+        if bindings.accessors is not None:
+            paths.append(('compiled accessors', doc.toAST))
+        return paths
+    with cmark.parse(txt) as doc:
+        expected, ok = doc._eventsToAST(), True
+        for label, fn in astPaths(doc):
+            def run():
+                for _ in range(iterations):
+                    out = fn()
+                return out
+            tt, elapsed = timed(run)
+            report(label, elapsed, iterations)
+            ok = ok and tt == expected
+    with cmark.parse(TWO_TABLES) as doc:
+        expected = doc._eventsToAST()
+        for label, fn in astPaths(doc):
+            if fn() != expected:
+                print('    {}: table alignments differ from ctypes events'.format(label))
+                ok = False
+    return ok
+
+def literalTexts(tt, text):
+    """Text of the literal nodes of an AST in preorder, with text(tt, node) reading a node's text"""
+    out, stack = [], list(reversed(tt.nodes))
+    while len(stack) > 0:
+        node = stack.pop()
+        if 'Text' in node._fields or 'lit' in node._fields:
+            out.append(text(tt, node))
+        stack += reversed(node.children)
+    return out
+
+def benchLean(txt, iterations):
+    """Compare object count, memory and build time of the toAST storage modes"""
+    ok = True
+    source_kb = len(txt.encode()) // 1024
+    with cmark.parse(txt) as doc:
+        for positions, literals in [('node', 'copy'), ('packed', 'copy'), (None, 'copy'), ('packed', 'packed'), (None, 'packed')]:
+            gc.collect()
+            n_objects = len(gc.get_objects())
+            tracemalloc.start()
+            tt = doc.toAST(positions=positions, literals=literals)
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            n_objects = len(gc.get_objects()) - n_objects
+            def run():
+                for _ in range(iterations):
+                    doc.toAST(positions=positions, literals=literals)
+            _, elapsed = timed(run)
+            report('toAST({!r}, {!r})'.format(positions, literals), elapsed, iterations)
+            print('    {} gc-tracked objects, {} KB retained ({} KB source), {} KB peak'.format(
+                n_objects, size // 1024, source_kb, peak // 1024))
+            if literals == 'packed':
+                packed = literalTexts(tt, cmark.CmarkDocument.packedLiteral)
+                if packed != literalTexts(doc.toAST(), lambda tt, node: node.Text):
+                    sys.stderr.write('Packed literals differ from copied text (positions={!r})\n'.format(positions))
+                    ok = False
+            del tt
+    return ok
+
+# documents whose blocks span blank lines or end differently at a shard boundary
+SHARD_CORPUS = [
+    '# Heading\n\nparagraph\nwith two lines\n\n    indented code\n\n    more code\n\nafter code\n',
+    '```\nfenced\n\nnot a boundary\n```\n\n~~~~ info\n~~~\n\nstill code\n~~~~\n\ntext\n\n```\nunclosed\n\ntail\n',
+    '- item\n\n- loose item\n\n  continued\n\nafter list\n\n1. one\n2. two\n\n\nafter ordered list\n',
+    '> quote\n\n> another quote\n\n| a | b |\n|:--|--:|\n| 1 | 2 |\n\nafter table\n',
+    '<!--\ncomment\n\nstill comment\n-->\n\n<div>\nhtml\n</div>\n\n<pre>\n\npre\n</pre>\n\ntext\n',
+    'line\r\n\r\nwindows line endings\r\n\r\n$$x^2$$ and \\\\(y\\\\)\n\nsetext\n---\n\n***\n',
+    '> [quoted]: /quoted\n\nlink to [quoted]\n\n- [listed]: /listed\n\n[listed] link\n\n1. > [nested]: /nested\n\n[nested] link\n',
+]
+
+def stripDefinitions(txt):
+    """Remove lines that start link reference definitions, so that the document can be sharded"""
+    return re.sub(r'(?m)^[ \t]*(?:(?:>|[-+*]|\d{1,9}[.)])[ \t]*)*\[[^\]]+\]:.*$', '', txt)
+
+def checkShards(txt, iterations, copies=20):
+    """Compare parseSharded with a whole-document parse on a corpus and time both"""
+    ok = True
+    corpus = SHARD_CORPUS + [stripDefinitions('\n'.join(SHARD_CORPUS)), stripDefinitions(txt), txt]
+    for doc in corpus:
+        with cmark.parse(doc) as whole:
+            expected = whole.toAST()
+        for shard_size in [1, 64, len(doc)]:
+            if cmark.parseSharded(doc, shard_size=shard_size) != expected:
+                sys.stderr.write('Sharded parse (shard_size={}) differs for:\n{}\n'.format(shard_size, doc))
+                ok = False
+
+    # time a large document that splits into many shards
+    big = '\n'.join([corpus[-2]] * copies)
+    def full():
+        for _ in range(iterations):
+            with cmark.parse(big) as doc:
+                out = doc.toAST()
+        return out
+    def sharded():
+        for _ in range(iterations):
+            out = cmark.parseSharded(big, shard_size=len(big) // (os.cpu_count() or 1) + 1)
+        return out
+    (tt_full, t_full), (tt_sharded, t_sharded) = timed(full), timed(sharded)
+    report('parse + toAST ({} KB)'.format(len(big) // 1024), t_full, iterations)
+    report('parseSharded', t_sharded, iterations)
+    return ok and tt_full == tt_sharded
+
+def benchOutline(txt, iterations):
+    """Compare the vim table of contents built from a full AST with one built from the outline"""
+    from pycmark.taggedtext.render.VimRenderer import VimRenderer
+    def toc(source):
+        for _ in range(iterations):
+            out = VimRenderer.getTOC(source(), withUnicode=False)
+        return out
+    def ast():
+        with cmark.parse(txt) as doc:
+            return doc.toAST()
+    (toc_ast, t_ast), (toc_outline, t_outline) = timed(toc, ast), timed(toc, lambda: cmark.outline(txt))
+    report('parse + toAST + getTOC', t_ast, iterations)
+    report('outline + getTOC', t_outline, iterations)
+    return toc_ast == toc_outline
+
+def benchNodes(txt, iterations):
+    """Report memory and construction time per AST node"""
+    from pycmark.util.TypedTree import TypedTree
+    def count(x):
+        if isinstance(x, TypedTree.TT):
+            return 1 + sum(count(v) for v in x)
+        elif isinstance(x, tuple):
+            return sum(count(v) for v in x)
+        return 0
+    with cmark.parse(txt) as doc:
+        tracemalloc.start()
+        tt = doc.toAST()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        n_nodes = count(tt)
+        def run():
+            for _ in range(iterations):
+                doc.toAST()
+        _, elapsed = timed(run)
+    report('toAST ({} nodes)'.format(n_nodes), elapsed, iterations)
+    print('    {:.1f} bytes per node, {:.3f} us per node'.format(
+        size / n_nodes, elapsed * 1e6 / iterations / n_nodes))
+    return not hasattr(tt, '__dict__')
+
+def benchBuild(txt, iterations):
+    """Compare rebuilding a real AST with TypedTree.Build and trusted constructors"""
+    from pycmark.util.TypedTree import TypedTree
+    with cmark.parse(txt) as doc:
+        tt = doc.toAST()
+    def build(x):
+        if isinstance(x, TypedTree.TT):
+            return TypedTree.Build(x._tag, **dict(zip(x._fields, [build(v) for v in x])))
+        elif isinstance(x, tuple):
+            return [build(v) for v in x]  # lists, as the AST decoders pass them
+        return x
+    def trusted(x):
+        if isinstance(x, TypedTree.TT):
+            return TypedTree.Trusted(x._tag, x._fields)(*[trusted(v) for v in x])
+        elif isinstance(x, tuple):
+            return tuple([trusted(v) for v in x])
+        return x
+    def run(fn):
+        for _ in range(iterations):
+            out = fn(tt)
+        return out
+    (tt_build, t_build), (tt_trusted, t_trusted) = timed(run, build), timed(run, trusted)
+    report('TypedTree.Build', t_build, iterations)
+    report('TypedTree.Trusted', t_trusted, iterations)
+    return tt_build == tt and tt_trusted == tt
+
+def benchSerialize(txt, iterations, copies=20):
+    """Compare size and load time of JSON and binary AST files"""
+    import tempfile
+    from pycmark.util.TypedTree import TypedTree
+    with cmark.parse('\n'.join([txt] * copies)) as doc:
+        tt = doc.toAST()
+    js, binary = tt._tojson(), tt._tobinary()
+    with tempfile.NamedTemporaryFile(suffix='.ttb', delete=False) as F:
+        F.write(binary)
+    try:
+        def run(fn, *args):
+            for _ in range(iterations):
+                out = fn(*args)
+            return out
+        tt_json, t_json = timed(run, TypedTree._fromjson, js)
+        tt_binary, t_binary = timed(run, TypedTree._loadbinary, F.name)
+    finally:
+        os.unlink(F.name)
+    report('_fromjson ({} KB)'.format(len(js) // 1024), t_json, iterations)
+    report('_loadbinary ({} KB)'.format(len(binary) // 1024), t_binary, iterations)
+    return tt_json == tt and tt_binary == tt
+
+def benchStream(txt, iterations, copies=20):
+    """Compare peak memory of whole-string JSON with the streaming writer and reader"""
+    import tempfile
+    from pycmark.util.TypedTree import TypedTree, JSON_VERSION
+    with cmark.parse('\n'.join([txt] * copies)) as doc:
+        tt = doc.toAST()
+    fd, name = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    def traced(label, fn):
+        tracemalloc.start()
+        out, elapsed = timed(fn)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report(label, elapsed)
+        print('    {} KB peak'.format(peak // 1024))
+        return out
+    def write(stream, version):
+        with open(name, 'wt') as F:
+            if stream:
+                tt._writejson(F, version)
+            else:
+                F.write(tt._tojson(version))
+    def read(stream):
+        with open(name, 'rt') as F:
+            if stream:
+                return TypedTree._readjson(F)
+            return TypedTree._fromjson(F.read())
+    def count():
+        with open(name, 'rt') as F:
+            return sum(1 for _ in TypedTree._iterjson(F))
+    ok = True
+    try:
+        for version in [1, JSON_VERSION]:
+            traced('_tojson + write (version {})'.format(version), lambda: write(False, version))
+            expected = open(name, 'rt').read()
+            traced('_writejson (version {})'.format(version), lambda: write(True, version))
+            ok = open(name, 'rt').read() == expected and ok
+            ok = traced('read + _fromjson (version {})'.format(version), lambda: read(False)) == tt and ok
+            ok = traced('_readjson (version {})'.format(version), lambda: read(True)) == tt and ok
+            ok = traced('_iterjson (version {}, top-level nodes only)'.format(version), count) == len(tt.nodes) and ok
+    finally:
+        os.unlink(name)
+    return ok
+
+def benchSchema(txt, iterations, copies=20):
+    """Compare size and decode time of the version 1 and version 2 JSON schemas"""
+    import io
+    from pycmark.util.TypedTree import TypedTree, JSON_VERSION
+    with cmark.parse('\n'.join([txt] * copies)) as doc:
+        tt = doc.toAST()
+        from_view = TypedTree._fromjson(doc.toAST(lazy=True)._tojson(JSON_VERSION))  # views aren't tuples
+    v1, v2 = tt._tojson(), tt._tojson(JSON_VERSION)
+    def run(fn, *args):
+        for _ in range(iterations):
+            out = fn(*args)
+        return out
+    tt_v1, t_v1 = timed(run, TypedTree._fromjson, v1)
+    tt_v2, t_v2 = timed(run, TypedTree._fromjson, v2)
+    tt_stream, t_stream = timed(run, lambda: TypedTree._readjson(io.StringIO(v2)))
+    report('_fromjson version 1 ({} KB)'.format(len(v1) // 1024), t_v1, iterations)
+    report('_fromjson version 2 ({} KB)'.format(len(v2) // 1024), t_v2, iterations)
+    report('_readjson version 2', t_stream, iterations)
+    # sorted keys put the root before the header, which the streaming readers read whole
+    v2_sorted = tt._tojson(JSON_VERSION, sort_keys=True)
+    ok = TypedTree._readjson(io.StringIO(v2_sorted)) == tt
+    ok = tuple(TypedTree._iterjson(io.StringIO(v2_sorted))) == tt.nodes and ok
+    return ok and tt_v1 == tt and tt_v2 == tt and tt_stream == tt and from_view == tt
+
+def benchIntern(txt, iterations, copies=20):
+    """Compare retained memory and equality checks of plain and hash-consed ASTs"""
+    from pycmark.util.TypedTree import TypedTree
+    txt = '\n'.join([txt] * copies)
+    def build(intern):
+        with cmark.parse(txt) as doc:
+            tracemalloc.start()
+            tt, elapsed = timed(doc.toAST, positions=None, intern=intern)
+            size, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return tt, elapsed, size
+    def compare(a, b):
+        for _ in range(iterations):
+            out = a == b
+        return out
+    interner = TypedTree.Interner()
+    (plain, t_plain, m_plain), (plain2, _, _) = build(None), build(None)
+    (interned, t_interned, m_interned), (interned2, _, _) = build(interner), build(interner)
+    report('toAST(positions=None)', t_plain)
+    print('    {} KB retained'.format(m_plain // 1024))
+    report('toAST(positions=None, intern=...)', t_interned)
+    print('    {} KB retained, {} distinct subtrees'.format(m_interned // 1024, len(interner)))
+    ok, t_eq = timed(compare, plain, plain2)
+    report('== (separate trees)', t_eq, iterations)
+    ok_interned, t_eq = timed(compare, interned, interned2)
+    report('== (interned trees)', t_eq, iterations)
+    return ok and ok_interned and interned is interned2 and interned == plain
+
+def benchDiff(txt, iterations, copies=20):
+    """Time TreeDiff.diff between an AST and its incremental reparse after a one-line edit"""
+    from pycmark.util.TreeDiff import diff
+    lines = txt.splitlines() * copies
+    with cmark.parse('\n'.join(lines) + '\n') as doc:
+        tt = doc.toAST()
+    line = len(lines) // 2
+    _, edited = cmark.CmarkDocument.reparse(tt, lines, line, line, [lines[line-1] + ' edited'])
+    def run(*args, **kwargs):
+        for _ in range(iterations):
+            out = diff(*args, **kwargs)
+        return out
+    edits, elapsed = timed(run, tt, edited)
+    report('diff ({} edits)'.format(len(edits)), elapsed, iterations)
+    edits_content, elapsed = timed(run, tt, edited, ignore=('position',))
+    report('diff ignoring positions ({} edits)'.format(len(edits_content)), elapsed, iterations)
+    for edit in edits_content:
+        print('    {!r}'.format(edit))
+    return len(edits_content) > 0 and len(edits) >= len(edits_content) and diff(tt, tt) == []
+
+def benchUpdate(txt, iterations, copies=20):
+    """Compare replacing the deepest node of an AST by rebuilding it and by path copying"""
+    from pycmark.util.TypedTree import TypedTree
+    with cmark.parse('\n'.join([txt] * copies)) as doc:
+        tt = doc.toAST()
+
+    # path of the deepest node
+    deepest, stack = (), [((), tt)]
+    while len(stack) > 0:
+        path, x = stack.pop()
+        if isinstance(x, TypedTree.TT) and len(path) > len(deepest):
+            deepest = path
+        if isinstance(x, tuple):
+            keys = x._fields if isinstance(x, TypedTree.TT) else range(len(x))
+            stack += [(path + (k,), v) for k, v in zip(keys, x) if isinstance(v, tuple)]
+    new = TypedTree.Build('text', Text='replaced', children=[])
+
+    def rebuild(x, path=()):
+        if path == deepest:
+            return new
+        elif isinstance(x, TypedTree.TT):
+            return TypedTree.Build(x._tag, **dict([(k, rebuild(v, path + (k,))) for k, v in zip(x._fields, x)]))
+        elif isinstance(x, tuple):
+            return [rebuild(v, path + (i,)) for i, v in enumerate(x)]
+        return x
+    def run(fn):
+        for _ in range(iterations):
+            out = fn()
+        return out
+    tt_build, t_build = timed(run, lambda: rebuild(tt))
+    tt_copy, t_copy = timed(run, lambda: tt._replaceAt(deepest, new))
+    report('rebuild with TypedTree.Build', t_build, iterations)
+    report('_replaceAt (depth {})'.format(len(deepest)), t_copy, iterations)
+    shared = all([a is b for i, (a, b) in enumerate(zip(tt.nodes, tt_copy.nodes)) if i != deepest[1]])
+    return tt_build == tt_copy and tt_copy._getAt(deepest) is new and shared
+
+def pickleWorker(txt):
+    """Process pool task for benchPickle: parse in a worker process and return the AST"""
+    with cmark.parse(txt) as doc:
+        return doc.toAST()
+
+def benchPickle(txt, iterations, copies=20, workers=2):
+    """Time pickle round trips of an AST and a DocumentTree and returning ASTs from worker processes"""
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor
+    from pycmark.ast.DocumentTree import DocumentTree
+    txt = '\n'.join([txt] * copies)
+    tt = pickleWorker(txt)
+    ok = True
+    for label, x in [('AST', tt), ('DocumentTree', DocumentTree.fromAst(tt))]:
+        data, t_dumps = timed(pickle.dumps, x, pickle.HIGHEST_PROTOCOL)
+        out, t_loads = timed(pickle.loads, data)
+        report('pickle.dumps {} ({} KB)'.format(label, len(data) // 1024), t_dumps)
+        report('pickle.loads {}'.format(label), t_loads)
+        ok = ok and out == x and type(out) is type(x)
+        # a DocumentTree is one binary payload, so it should cost little more than its AST
+        ok = ok and len(data) < 2 * len(tt._tobinary())
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        out, elapsed = timed(lambda: list(pool.map(pickleWorker, [txt] * iterations)))
+    report('toAST in {} worker processes'.format(workers), elapsed, iterations)
+    return ok and all([x == tt for x in out])
+
+################################################################################
+
+if __name__ == '__main__':
+
+    # parse input arguments
+    parser = argparse.ArgumentParser(
+        description=HELP_TEXT,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('infile', help="markdown file to process", nargs='?')
+    parser.add_argument('--action', help="Benchmark action", default="Soak")
+    parser.add_argument('--iterations', help="Number of iterations", type=int, default=10000)
+    args = parser.parse_args()
+
+    # read input data
+    txt = open(args.infile if args.infile is not None else SAMPLE, 'rt').read()
+
+    # perform action
+    if args.action == 'Soak':
+        ok = soak(txt, args.iterations)
+    elif args.action == 'Parse':
+        ok = benchParse(txt, args.iterations)
+    elif args.action == 'Import':
+        ok = benchImport()
+    elif args.action == 'Threads':
+        ok = benchThreads(txt, args.iterations)
+    elif args.action == 'Lazy':
+        ok = benchLazy(txt, args.iterations)
+    elif args.action == 'Events':
+        ok = checkEvents()
+    elif args.action == 'Reparse':
+        ok = benchReparse(txt, args.iterations)
+    elif args.action == 'Pathological':
+        ok = checkPathological()
+    elif args.action == 'AST':
+        ok = benchAST(txt, args.iterations)
+    elif args.action == 'Lean':
+        ok = benchLean(txt, args.iterations)
+    elif args.action == 'Shards':
+        ok = checkShards(txt, args.iterations)
+    elif args.action == 'Outline':
+        ok = benchOutline(txt, args.iterations)
+    elif args.action == 'Nodes':
+        ok = benchNodes(txt, args.iterations)
+    elif args.action == 'Build':
+        ok = benchBuild(txt, args.iterations)
+    elif args.action == 'Serialize':
+        ok = benchSerialize(txt, args.iterations)
+    elif args.action == 'Stream':
+        ok = benchStream(txt, args.iterations)
+    elif args.action == 'Schema':
+        ok = benchSchema(txt, args.iterations)
+    elif args.action == 'Intern':
+        ok = benchIntern(txt, args.iterations)
+    elif args.action == 'Diff':
+        ok = benchDiff(txt, args.iterations)
+    elif args.action == 'Update':
+        ok = benchUpdate(txt, args.iterations)
+    elif args.action == 'Pickle':
+        ok = benchPickle(txt, args.iterations)
+    else:
+        sys.stderr.write("Valid actions: Soak, Parse, Import, Threads, Lazy, Events, Reparse, Pathological, AST, Lean, Shards, Outline, Nodes, Build, Serialize, Stream, Schema, Intern, Diff, Update, Pickle\n")
+        sys.exit(1)
+    sys.exit(0 if ok else 1)
@@ -5,6 +5,7 @@ from pyevernote.EvernoteMetadata import EvernoteMetadata
 from pycmark.html.HTML_Generator import toStyledHTML
 import pycmark.cmarkgfm as cmark
 from pycmark.ast.DocumentTree import DocumentTree
+from pycmark.util.TypedTree import JSON_VERSION
 from pycmark.taggedtext.render.RtfRenderer import RtfRenderer
 
 # determine output directories and create if necessary
@@ -91,13 +92,16 @@ for note in active_notes:
     with open(basefile + '.ast', 'wt') as F:
         F.write(ast.__repr__())
     with open(basefile + '.json', 'wt') as F:
-        F.write(ast._tojson())
+        ast._writejson(F, version=JSON_VERSION)
     with open(os.path.join(syncdata, 'json', note.notebook, note.escapedtitle) + '.json', 'wt') as F:
-        F.write(ast._tojson())
+        ast._writejson(F, version=JSON_VERSION)
+    with open(os.path.join(syncdata, 'json', note.notebook, note.escapedtitle) + '.ttb', 'wb') as F:
+        F.write(ast._tobinary())
 
     # rendered latex
-    with open(basefile + '.latex', 'wb') as F:
-        F.write(cmark.mdToLatex(note_md.replace('[TOC]', '')))
+    with open(basefile + '.latex', 'wt') as F:
+        F.write(doc.toLatex())
+    doc.close()
 
     # RTF
     dt = DocumentTree.fromAst(ast)  # hierarchical document tree
@@ -194,10 +194,10 @@ endfunction
 autocmd!
 
 " call processing fuction when a new file is loaded
-autocmd BufRead *.json call ParseJSON()
+autocmd BufRead *.json,*.ttb call ParseJSON()
 
 " clear existing buffers when a new file is loaded
-autocmd BufReadPre *.json :call CloseBuffers()
+autocmd BufReadPre *.json,*.ttb :call CloseBuffers()
 
 " NERDTree configuration
 let NERDTreeIgnore=['\.md$', '\.html$', '\.md\.pdf$']